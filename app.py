@@ -2,14 +2,28 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import json
 from dotenv import load_dotenv
 from itertools import cycle
 import aiohttp
-from openai import OpenAI
 import random
+import heapq
+import bisect
+import hashlib
+import re
+import signal
+import time
+from collections import deque, OrderedDict
+from near_dup import NearDuplicateIndex
+from ranking import RankIndex
+from text_index import InvertedIndex
+import threading
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 # =============================
 # Load tokens from .env
@@ -34,16 +48,142 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 intents.reactions = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Nothing reads the message cache (project votes come from raw reaction events), so keep it small.
+bot = commands.Bot(command_prefix="!", intents=intents, max_messages=int(os.getenv("MESSAGE_CACHE_SIZE", "100")))
 tree = bot.tree
 
 # =============================
 # OpenRouter client
 # =============================
-client = OpenAI(
-    api_key=OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1"
-) if OPENROUTER_API_KEY else None
+# One shared aiohttp session (keep-alive pool) for every chat completion, with a
+# semaphore bounding in-flight requests and a per-request timeout.
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "8"))
+OPENROUTER_TIMEOUT_SECONDS = float(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "30"))
+_http_session = None
+_openrouter_slots = None
+
+class OpenRouterError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+def _openrouter_session():
+    global _http_session, _openrouter_slots
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=OPENROUTER_MAX_CONCURRENCY, keepalive_timeout=60)
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"}
+        )
+        _openrouter_slots = asyncio.Semaphore(OPENROUTER_MAX_CONCURRENCY)
+    return _http_session
+
+async def chat_completion(model, messages, max_tokens, temperature=0.7, timeout=OPENROUTER_TIMEOUT_SECONDS):
+    session = _openrouter_session()
+    payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    async with _openrouter_slots:
+        async with session.post(OPENROUTER_URL, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                raise OpenRouterError(resp.status, (await resp.text())[:200])
+            body = await resp.json()
+    # OpenRouter reports upstream failures (e.g. provider rate limits) inside a 200 body.
+    if "error" in body:
+        raise OpenRouterError(body["error"].get("code", 502), body["error"].get("message", ""))
+    return (body["choices"][0]["message"]["content"] or "").strip()
+
+# Hedged requests: start the preferred model, add the next one every
+# AI_HEDGE_DELAY_SECONDS without an answer (or as soon as one fails), keep the first
+# valid result and cancel the rest. A delay of 0 tries the models one at a time.
+AI_HEDGE_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DELAY_SECONDS", "3"))
+AI_HEDGE_MAX_PARALLEL = int(os.getenv("AI_HEDGE_MAX_PARALLEL", "3"))
+
+async def race_models(models, attempt):
+    # attempt(model) returns a result, or None when the model failed or answered badly.
+    remaining = iter(models)
+    pending = set()
+
+    def launch():
+        model = next(remaining, None)
+        if model is not None:
+            pending.add(asyncio.create_task(attempt(model)))
+
+    launch()
+    delay = AI_HEDGE_DELAY_SECONDS if AI_HEDGE_DELAY_SECONDS > 0 else None
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if len(pending) < AI_HEDGE_MAX_PARALLEL:
+                    launch()
+                continue
+            for task in done:
+                pending.discard(task)
+                result = None if task.cancelled() or task.exception() else task.result()
+                if result is not None:
+                    return result
+                launch()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+# Model router: rolling latency, validity and error stats per model (persisted in
+# model_stats.json) decide the order models are tried in. A model that fails
+# MODEL_BREAKER_FAILURES times in a row is skipped until its backoff expires.
+MODEL_LATENCY_WINDOW = 50
+MODEL_DEFAULT_LATENCY = 5.0
+MODEL_BREAKER_FAILURES = int(os.getenv("MODEL_BREAKER_FAILURES", "3"))
+MODEL_BREAKER_SECONDS = int(os.getenv("MODEL_BREAKER_SECONDS", "60"))
+
+def record_model_result(model, outcome, latency=None, status=None):
+    # outcome: "valid", "invalid" (answered but unusable) or "error" (HTTP/network failure).
+    s = model_stats.setdefault(model, {"latencies": [], "calls": 0, "valid": 0, "invalid": 0, "rate_limited": 0, "server_errors": 0, "errors": 0, "failure_streak": 0, "open_until": 0})
+    s["calls"] += 1
+    if latency is not None:
+        s["latencies"] = (s["latencies"] + [round(latency, 3)])[-MODEL_LATENCY_WINDOW:]
+    if outcome == "valid":
+        s["valid"] += 1
+        s["failure_streak"] = 0
+    else:
+        if outcome == "invalid":
+            s["invalid"] += 1
+        elif status == 429:
+            s["rate_limited"] += 1
+        elif status and status >= 500:
+            s["server_errors"] += 1
+        else:
+            s["errors"] += 1
+        s["failure_streak"] += 1
+        if s["failure_streak"] >= MODEL_BREAKER_FAILURES:
+            backoff = MODEL_BREAKER_SECONDS * 2 ** min(s["failure_streak"] - MODEL_BREAKER_FAILURES, 4)
+            s["open_until"] = time.time() + backoff
+    mark_dirty(MODEL_STATS_FILE, [model])
+
+def model_percentile(model, pct):
+    latencies = sorted(model_stats.get(model, {}).get("latencies", []))
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, int(len(latencies) * pct))]
+
+def _model_score(model):
+    # Expected seconds to a valid answer: p90 latency over a smoothed validity rate.
+    s = model_stats.get(model)
+    if not s:
+        return MODEL_DEFAULT_LATENCY * 2
+    p90 = model_percentile(model, 0.9) or MODEL_DEFAULT_LATENCY
+    return p90 * (s["calls"] + 2) / (s["valid"] + 1)
+
+def route_models(models):
+    now = time.time()
+    closed = [m for m in models if model_stats.get(m, {}).get("open_until", 0) <= now]
+    tripped = sorted((m for m in models if m not in closed), key=lambda m: model_stats[m]["open_until"])
+    # Tripped models stay at the back as a last resort rather than being dropped.
+    return sorted(closed, key=_model_score) + tripped
+
+async def close_http_session():
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
 
 # =============================
 # JSON persistence
@@ -56,18 +196,320 @@ EVENTS_FILE = "events.json"
 QUIZZES_FILE = "quizzes.json"
 CHALLENGES_FILE = "challenges.json"
 PROGRESS_FILE = "progress.json"
+MODEL_STATS_FILE = "model_stats.json"
+QUESTION_BANK_FILE = "question_bank.json"
+PROJECT_VOTES_FILE = "project_votes.json"
 
-def load_json(file, default):
+# Each store is a snapshot file (e.g. progress.json) plus an append-only log
+# (progress.json.wal) of compact per-key mutation records. save_json only appends
+# the keys whose value changed; load_json replays the log over the snapshot and
+# compact_stores folds it back into the snapshot in a worker thread.
+WAL_COMPACT_BYTES = int(os.getenv("WAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+_wal_lock = threading.Lock()
+_wal_hashes = {}
+_wal_lengths = {}
+_wal_sizes = {}
+_wal_empty = {}
+_wal_defaults = {}
+
+def _dump(value):
+    return json.dumps(value, separators=(",", ":"))
+
+def _apply_record(data, rec):
+    op = rec["op"]
+    if op == "set":
+        if isinstance(data, list):
+            idx = rec["k"]
+            if idx >= len(data):
+                data.extend([None] * (idx + 1 - len(data)))
+            data[idx] = rec["v"]
+        elif isinstance(rec["k"], list):
+            key, subkey = rec["k"]
+            data.setdefault(key, {})[subkey] = rec["v"]
+        else:
+            data[rec["k"]] = rec["v"]
+    elif op == "del":
+        if isinstance(rec["k"], list):
+            key, subkey = rec["k"]
+            data.get(key, {}).pop(subkey, None)
+        else:
+            data.pop(rec["k"], None)
+    elif op == "trunc":
+        del data[rec["n"]:]
+    return data
+
+def _replay_file(path, data):
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return data
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            # Torn record from a crash mid-append; the records around it are intact.
+            print(f"Skipping truncated log record in {path}")
+            continue
+        data = _apply_record(data, rec)
+    if raw and not raw.endswith(b"\n"):
+        # Terminate the torn line so the next append starts a record of its own.
+        with open(path, "ab") as f:
+            f.write(b"\n")
+    return data
+
+def _track(file, data):
+    if isinstance(data, list):
+        _wal_hashes[file] = {i: hash(_dump(v)) for i, v in enumerate(data)}
+        _wal_lengths[file] = len(data)
+    else:
+        _wal_hashes[file] = {k: hash(_dump(v)) for k, v in data.items()}
+    _wal_empty[file] = type(data)
+    if STORAGE_BACKEND == "json":
+        try:
+            _wal_sizes[file] = os.path.getsize(file + ".wal")
+        except OSError:
+            _wal_sizes[file] = 0
+
+def _json_load(file, default):
     try:
         with open(file, "r") as f:
             data = json.load(f)
-            return data if isinstance(data, dict) or isinstance(data, list) else default
+            data = data if isinstance(data, dict) or isinstance(data, list) else default
     except FileNotFoundError:
-        return default
+        data = default
+    # Records in .compacting were not folded into the snapshot yet; replaying is idempotent.
+    data = _replay_file(file + ".wal.compacting", data)
+    return _replay_file(file + ".wal", data)
 
-def save_json(file, data):
-    with open(file, "w") as f:
+def load_json(file, default):
+    # Serialized before loading: when there is no snapshot, default becomes the live store.
+    _wal_defaults[file] = _dump(default)
+    data = _sql_load(file, default) if STORAGE_BACKEND == "sqlite" else _json_load(file, default)
+    _track(file, data)
+    return data
+
+def _changes(file, data, keys=None):
+    # Returns (op, key, serialized value) tuples for keys whose value differs from what was last persisted.
+    if file not in _wal_hashes or _wal_empty[file] is not type(data):
+        _track(file, type(data)())
+    hashes = _wal_hashes[file]
+    changes = []
+    if isinstance(data, list):
+        for i in (range(len(data)) if keys is None else keys):
+            if i >= len(data):
+                continue
+            s = _dump(data[i])
+            h = hash(s)
+            if hashes.get(i) != h:
+                hashes[i] = h
+                changes.append(("set", i, s))
+        if _wal_lengths.get(file, 0) > len(data):
+            for i in range(len(data), _wal_lengths[file]):
+                hashes.pop(i, None)
+            changes.append(("trunc", len(data), _wal_lengths[file]))
+        _wal_lengths[file] = len(data)
+    else:
+        for k in (set(data) | {h for h in hashes if not isinstance(h, tuple)} if keys is None else keys):
+            if isinstance(k, tuple):
+                # (key, subkey) is one entry of a nested map, e.g. ("user_progress", user_id).
+                parent = data.get(k[0])
+                present = isinstance(parent, dict) and k[1] in parent
+                value = parent[k[1]] if present else None
+            else:
+                present = k in data
+                value = data.get(k)
+            if present:
+                s = _dump(value)
+                h = hash(s)
+                if hashes.get(k) != h:
+                    hashes[k] = h
+                    changes.append(("set", k, s))
+                    _forget_related(hashes, k)
+            elif k in hashes or isinstance(k, tuple):
+                # A nested entry may have been persisted before this run without being hashed.
+                hashes.pop(k, None)
+                changes.append(("del", k, None))
+                _forget_related(hashes, k)
+    return changes
+
+def _forget_related(hashes, key):
+    # Writing an entry leaves the hash of its whole map stale, and writing a whole map
+    # leaves the hashes of its entries stale; None never matches, so they get rewritten.
+    if isinstance(key, tuple):
+        hashes[key[0]] = None
+    else:
+        for entry in [h for h in hashes if isinstance(h, tuple) and h[0] == key]:
+            del hashes[entry]
+
+def _wal_append(file, changes):
+    lines = []
+    for op, key, value in changes:
+        if op == "set":
+            lines.append('{"op":"set","k":%s,"v":%s}' % (_dump(key), value))
+        elif op == "del":
+            lines.append('{"op":"del","k":%s}' % _dump(key))
+        else:
+            lines.append('{"op":"trunc","n":%d}' % key)
+    payload = "\n".join(lines) + "\n"
+    with _wal_lock:
+        with open(file + ".wal", "a") as f:
+            f.write(payload)
+        _wal_sizes[file] = _wal_sizes.get(file, 0) + len(payload)
+
+def _persist(file, changes):
+    if STORAGE_BACKEND == "sqlite":
+        _sql_apply(file, changes)
+    else:
+        _wal_append(file, changes)
+
+def save_json(file, data, keys=None):
+    # keys: the top-level keys (or list indexes) that changed; None diffs the whole store.
+    changes = _changes(file, data, keys)
+    if changes:
+        _persist(file, changes)
+
+def compact_json(file):
+    wal = file + ".wal"
+    pending = wal + ".compacting"
+    with _wal_lock:
+        if not os.path.exists(pending):
+            if not os.path.exists(wal):
+                return
+            os.replace(wal, pending)
+            _wal_sizes[file] = 0
+    try:
+        with open(file, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        # Same starting point as load_json, so keys never changed from their default survive.
+        data = json.loads(_wal_defaults[file]) if file in _wal_defaults else _wal_empty.get(file, dict)()
+    data = _replay_file(pending, data)
+    tmp = file + ".tmp"
+    with open(tmp, "w") as f:
         json.dump(data, f, indent=4)
+    os.replace(tmp, file)
+    os.remove(pending)
+
+# =============================
+# SQLite backend (STORAGE_BACKEND=sqlite)
+# =============================
+# SQLite is a persistence layer only: the stores are loaded into memory at startup
+# and the leaderboard, due-date and project lookups are served by in-memory indexes.
+# The hot stores get their own tables with per-row upserts; everything else lives in kv.
+# `python app.py migrate-sqlite` copies the current JSON stores into SQLITE_PATH.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "bot.db")
+SQL_TABLES = {PROGRESS_FILE: "progress", TASKS_FILE: "tasks", REMINDERS_FILE: "reminders", PROJECTS_FILE: "projects"}
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (user_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tasks (user_id TEXT NOT NULL, idx INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (user_id, idx));
+CREATE TABLE IF NOT EXISTS reminders (key TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS projects (idx INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS kv (store TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (store, key));
+"""
+_sql = None
+
+def _sql_conn():
+    global _sql
+    if _sql is None:
+        # Only touched at import and from the single flush thread afterwards.
+        _sql = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+        _sql.execute("PRAGMA journal_mode=WAL")
+        _sql.executescript(SQL_SCHEMA)
+    return _sql
+
+def _sql_load(file, default):
+    db = _sql_conn()
+    table = SQL_TABLES.get(file)
+    entries = []
+    if table == "progress":
+        data = {uid: json.loads(d) for uid, d in db.execute("SELECT user_id, data FROM progress")}
+    elif table == "tasks":
+        data = {}
+        for uid, d in db.execute("SELECT user_id, data FROM tasks ORDER BY user_id, idx"):
+            data.setdefault(uid, []).append(json.loads(d))
+    elif table == "reminders":
+        data = {key: json.loads(d) for key, d in db.execute("SELECT key, data FROM reminders")}
+    elif table == "projects":
+        data = [json.loads(d) for (d,) in db.execute("SELECT data FROM projects ORDER BY idx")]
+    else:
+        data = {}
+        for key, v in db.execute("SELECT key, value FROM kv WHERE store = ?", (file,)):
+            # Nested entries are stored under their JSON-encoded [key, subkey] path.
+            if key.startswith("["):
+                entries.append((json.loads(key), json.loads(v)))
+            else:
+                data[key] = json.loads(v)
+    if isinstance(default, dict):
+        # Keys still equal to their default were never written, so they aren't in the table.
+        data = {**default, **data}
+        for (key, subkey), value in entries:
+            data.setdefault(key, {})[subkey] = value
+        return data
+    return data or default
+
+def _sql_apply(file, changes):
+    db = _sql_conn()
+    table = SQL_TABLES.get(file)
+    with db:
+        for op, key, value in changes:
+            if table == "progress":
+                if op == "set":
+                    db.execute("INSERT OR REPLACE INTO progress (user_id, data) VALUES (?, ?)", (key, value))
+                else:
+                    db.execute("DELETE FROM progress WHERE user_id = ?", (key,))
+            elif table == "tasks":
+                db.execute("DELETE FROM tasks WHERE user_id = ?", (key,))
+                if op == "set":
+                    db.executemany(
+                        "INSERT INTO tasks (user_id, idx, data) VALUES (?, ?, ?)",
+                        [(key, i, _dump(t)) for i, t in enumerate(json.loads(value))]
+                    )
+            elif table == "reminders":
+                if op == "set":
+                    db.execute("INSERT OR REPLACE INTO reminders (key, data) VALUES (?, ?)", (key, value))
+                else:
+                    db.execute("DELETE FROM reminders WHERE key = ?", (key,))
+            elif table == "projects":
+                if op == "set":
+                    db.execute("INSERT OR REPLACE INTO projects (idx, data) VALUES (?, ?)", (key, value))
+                else:
+                    db.execute("DELETE FROM projects WHERE idx >= ?", (key,))
+            else:
+                if isinstance(key, tuple):
+                    key = _dump(key)
+                else:
+                    # A whole value replaces the nested entries written under it.
+                    prefix = _dump([key])[:-1]
+                    db.execute("DELETE FROM kv WHERE store = ? AND key > ? AND key < ?", (file, prefix + ",", prefix + "-"))
+                if op == "set":
+                    db.execute("INSERT OR REPLACE INTO kv (store, key, value) VALUES (?, ?, ?)", (file, key, value))
+                else:
+                    db.execute("DELETE FROM kv WHERE store = ? AND key = ?", (file, key))
+
+def migrate_json_to_sqlite():
+    for file in [TASKS_FILE, REMINDERS_FILE, RESOURCES_FILE, PROJECTS_FILE, EVENTS_FILE, QUIZZES_FILE, CHALLENGES_FILE, PROGRESS_FILE, MODEL_STATS_FILE, QUESTION_BANK_FILE, PROJECT_VOTES_FILE]:
+        if not os.path.exists(file) and not os.path.exists(file + ".wal"):
+            print(f"Skipping {file}: not found")
+            continue
+        data = _json_load(file, [] if file == PROJECTS_FILE else {})
+        items = enumerate(data) if isinstance(data, list) else data.items()
+        changes = [("set", k, _dump(v)) for k, v in items]
+        _sql_apply(file, changes)
+        print(f"Migrated {len(changes)} records from {file} into {SQLITE_PATH}")
+
+@tasks.loop(minutes=1)
+async def compact_stores():
+    for file, size in list(_wal_sizes.items()):
+        if size >= WAL_COMPACT_BYTES or os.path.exists(file + ".wal.compacting"):
+            try:
+                await asyncio.to_thread(compact_json, file)
+                print(f"Compacted {file}")
+            except Exception as e:
+                print(f"Compaction failed for {file}: {e}")
 
 tasks_data = load_json(TASKS_FILE, {})
 reminders = load_json(REMINDERS_FILE, {})
@@ -77,40 +519,538 @@ events = load_json(EVENTS_FILE, {})
 quizzes = load_json(QUIZZES_FILE, {"cybersecurity": [], "blender": [], "webdev": [], "blockchain": [], "general": []})
 challenges = load_json(CHALLENGES_FILE, {"current": None, "date": None, "user_progress": {}})
 progress_data = load_json(PROGRESS_FILE, {})
+model_stats = load_json(MODEL_STATS_FILE, {})
+question_bank = load_json(QUESTION_BANK_FILE, {})
+project_votes = load_json(PROJECT_VOTES_FILE, {})
+
+# =============================
+# Dirty tracking & flush scheduler
+# =============================
+# Handlers call mark_dirty instead of writing to disk. Dirty keys are coalesced and
+# flushed through a single-thread executor (so log appends stay ordered) every
+# FLUSH_INTERVAL_SECONDS, or sooner once FLUSH_DIRTY_THRESHOLD marks pile up.
+FLUSH_INTERVAL_SECONDS = float(os.getenv("FLUSH_INTERVAL_SECONDS", "5"))
+FLUSH_DIRTY_THRESHOLD = int(os.getenv("FLUSH_DIRTY_THRESHOLD", "200"))
+STORES = {
+    TASKS_FILE: tasks_data,
+    REMINDERS_FILE: reminders,
+    RESOURCES_FILE: resources,
+    PROJECTS_FILE: projects,
+    QUIZZES_FILE: quizzes,
+    CHALLENGES_FILE: challenges,
+    PROGRESS_FILE: progress_data,
+    MODEL_STATS_FILE: model_stats,
+    QUESTION_BANK_FILE: question_bank,
+    PROJECT_VOTES_FILE: project_votes,
+}
+_flush_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-flush")
+_dirty = {}
+_dirty_marks = 0
+_flush_pending = False
+_flush_task = None
+flush_stats = {"flushes": 0, "records": 0, "marks": 0}
+
+def mark_dirty(file, keys=None):
+    # keys=None means the whole store changed (e.g. after .clear()).
+    global _dirty_marks, _flush_pending, _flush_task
+    if keys is None:
+        _dirty[file] = None
+    elif file not in _dirty:
+        _dirty[file] = set(keys)
+    elif _dirty[file] is not None:
+        _dirty[file].update(keys)
+    _dirty_marks += 1
+    flush_stats["marks"] += 1
+    if _dirty_marks >= FLUSH_DIRTY_THRESHOLD and not _flush_pending:
+        try:
+            _flush_task = asyncio.get_running_loop().create_task(flush_stores_logged())
+            _flush_pending = True
+        except RuntimeError:
+            _flush_now()
+
+def _collect_dirty():
+    global _dirty, _dirty_marks, _flush_pending
+    dirty, _dirty, _dirty_marks, _flush_pending = _dirty, {}, 0, False
+    # Serialize on the caller's thread so the executor never sees a dict mid-mutation.
+    batch = []
+    for file, keys in dirty.items():
+        changes = _changes(file, STORES[file], keys)
+        if changes:
+            batch.append((file, changes))
+    return batch
+
+def _write_batch(batch):
+    for file, changes in batch:
+        _persist(file, changes)
+
+def _requeue(batch):
+    # _changes recorded these values as persisted; after a failed write, forget them
+    # and mark the keys dirty again so the next flush retries them.
+    for file, changes in batch:
+        hashes = _wal_hashes[file]
+        keys = _dirty.get(file, set())
+        for op, key, value in changes:
+            if op == "trunc":
+                _wal_lengths[file] = max(_wal_lengths.get(file, 0), value)
+            else:
+                hashes[key] = None
+                if keys is not None:
+                    keys.add(key)
+        _dirty[file] = keys
+
+def _flush_now():
+    batch = _collect_dirty()
+    try:
+        _write_batch(batch)
+    except Exception:
+        _requeue(batch)
+        raise
+
+async def flush_stores():
+    batch = _collect_dirty()
+    if not batch:
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(_flush_executor, _write_batch, batch)
+    except BaseException:
+        # Also on cancellation (e.g. shutdown while the job is queued behind another flush):
+        # the job may never run. If it already did, rewriting the records is harmless.
+        _requeue(batch)
+        raise
+    flush_stats["flushes"] += 1
+    flush_stats["records"] += sum(len(changes) for _, changes in batch)
+
+async def flush_stores_logged():
+    # flush_stores re-raises after re-queueing a failed batch; background callers only log it.
+    try:
+        await flush_stores()
+    except Exception as e:
+        print(f"Store flush failed: {e}")
+
+def flush_stores_sync():
+    _flush_executor.shutdown(wait=True)
+    _flush_now()
+
+# Open tasks with a due date, kept sorted as (due_date, user_id, task index) so the
+# daily notification job only bisects to the cutoff. Zero-padded ISO dates sort as
+# strings, so due dates are stored padded (strptime also accepts "2026-2-15").
+# Tasks are only ever appended, completed or cleared wholesale, so indexes stay valid.
+def normalize_due_date(due_date):
+    return datetime.strptime(due_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+for _uid, _user_tasks in tasks_data.items():
+    for _t in _user_tasks:
+        if _t["due_date"]:
+            try:
+                _padded = normalize_due_date(_t["due_date"])
+            except ValueError:
+                continue
+            if _padded != _t["due_date"]:
+                _t["due_date"] = _padded
+                mark_dirty(TASKS_FILE, [_uid])
+
+_due_index = sorted(
+    (t["due_date"], uid, i) for uid, user_tasks in tasks_data.items() for i, t in enumerate(user_tasks)
+    if t["due_date"] and not t["completed"]
+)
+
+def index_task_due(user_id, i):
+    task = tasks_data[user_id][i]
+    if task["due_date"] and not task["completed"]:
+        bisect.insort(_due_index, (task["due_date"], user_id, i))
+
+def unindex_task_due(user_id, i):
+    task = tasks_data[user_id][i]
+    if not task["due_date"] or task["completed"]:
+        return
+    entry = (task["due_date"], user_id, i)
+    pos = bisect.bisect_left(_due_index, entry)
+    if pos < len(_due_index) and _due_index[pos] == entry:
+        del _due_index[pos]
+
+def due_tasks(cutoff):
+    # (user_id, task index) for every open task due on or before cutoff (YYYY-MM-DD).
+    return [(uid, i) for _, uid, i in _due_index[:bisect.bisect_right(_due_index, (cutoff, "\uffff"))]]
+
+# Announcement message id -> index into projects. Projects posted before the message
+# id was stored ("legacy") are matched once from their embed and then backfilled: by
+# the footer timestamp where there is one, otherwise by the "🚀 New Project: {title}"
+# title plus the submitter name in the footer.
+_project_by_message = {p["message_id"]: i for i, p in enumerate(projects) if p.get("message_id")}
+_legacy_projects = {}
+for _i, _p in enumerate(projects):
+    if not _p.get("message_id"):
+        _legacy_projects.setdefault(_p["title"], []).append(_i)
+# Legacy announcements were all posted within a few minutes of their project, so a
+# message created after this can't be one (see _project_for_payload).
+_legacy_cutoff = max((datetime.fromisoformat(projects[i]["timestamp"]).timestamp() for ids in _legacy_projects.values() for i in ids), default=0) + 600
+# Announcement messages already fetched and found not to be projects (bounded, oldest dropped first).
+UNTRACKED_MESSAGES_MAX = 1000
+_untracked_messages = OrderedDict()
+
+def track_project_message(i, message_id):
+    projects[i]["message_id"] = message_id
+    _project_by_message[message_id] = i
+    legacy = _legacy_projects.get(projects[i]["title"])
+    if legacy and i in legacy:
+        legacy.remove(i)
+        if not legacy:
+            del _legacy_projects[projects[i]["title"]]
+    mark_dirty(PROJECTS_FILE, [i])
+
+def _match_legacy_project(embed):
+    title = (embed.title or "").removeprefix("🚀 New Project: ")
+    footer = (embed.footer.text or "").split(" | ")
+    candidates = _legacy_projects.get(title, [])
+    if len(footer) > 2:
+        candidates = [i for i in candidates if projects[i]["timestamp"] == footer[-1]]
+    elif len(candidates) > 1:
+        submitter = footer[0].removeprefix("Submitted by ")
+        candidates = [i for i in candidates if getattr(bot.get_user(int(projects[i]["user_id"])), "name", None) == submitter]
+    return candidates[0] if len(candidates) == 1 else None
+
+def find_project_index(message):
+    i = _project_by_message.get(message.id)
+    if i is None and _legacy_projects and message.embeds:
+        i = _match_legacy_project(message.embeds[0])
+        if i is not None:
+            track_project_message(i, message.id)
+    return i
+
+@tasks.loop(seconds=FLUSH_INTERVAL_SECONDS)
+async def flush_stores_loop():
+    await flush_stores_logged()
+
+# =============================
+# DM delivery
+# =============================
+# Outbound DMs go through a queue drained by a fixed pool of workers. Discord rate
+# limits each DM channel as its own route, so each user gets a sub-queue of pending
+# DMs and the shared queue holds user ids: a worker sends one DM for the user and
+# puts the id back at the end if more are waiting. Sends to one user are serialized
+# without parking other workers, and users are served round-robin; 429s and 5xx are
+# retried with backoff. Users with DMs closed are mentioned in REMINDER_CHANNEL_ID
+# instead, combined into one message per tick.
+DM_WORKERS = int(os.getenv("DM_WORKERS", "5"))
+DM_MAX_RETRIES = int(os.getenv("DM_MAX_RETRIES", "3"))
+DM_FALLBACK_INTERVAL_SECONDS = float(os.getenv("DM_FALLBACK_INTERVAL_SECONDS", "2"))
+_dm_queue = asyncio.Queue()
+_dm_pending = {}
+_dm_fallbacks = []
+_dm_latencies = deque(maxlen=500)
+_dm_workers = []
+dm_stats = {"sent": 0, "fallback": 0, "retries": 0, "failed": 0}
+
+def send_dm(user_id, content, fallback):
+    # Queues content for user_id; fallback is posted to REMINDER_CHANNEL_ID if the DM can't be delivered.
+    user_id = int(user_id)
+    pending = _dm_pending.get(user_id)
+    if pending is None:
+        # A user id is in _dm_queue (or held by a worker) exactly while it has pending DMs.
+        _dm_pending[user_id] = deque([(content, fallback, time.monotonic())])
+        _dm_queue.put_nowait(user_id)
+    else:
+        pending.append((content, fallback, time.monotonic()))
+
+def dm_queued():
+    return sum(len(pending) for pending in _dm_pending.values())
+
+def dm_latency(pct):
+    latencies = sorted(_dm_latencies)
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, int(len(latencies) * pct))]
+
+async def _deliver_dm(user_id, content):
+    channel = await bot.create_dm(bot.get_user(user_id) or discord.Object(id=user_id))
+    for attempt in range(DM_MAX_RETRIES + 1):
+        try:
+            await channel.send(content)
+            return True
+        except discord.Forbidden:
+            return False
+        except discord.HTTPException as e:
+            if attempt == DM_MAX_RETRIES or (e.status != 429 and e.status < 500):
+                return False
+            dm_stats["retries"] += 1
+            await asyncio.sleep(2 ** attempt + random.random())
+    return False
+
+async def _dm_worker():
+    while True:
+        user_id = await _dm_queue.get()
+        pending = _dm_pending[user_id]
+        content, fallback, queued_at = pending.popleft()
+        try:
+            delivered = await _deliver_dm(user_id, content)
+        except Exception as e:
+            print(f"DM to {user_id} failed: {e}")
+            delivered = False
+        if delivered:
+            dm_stats["sent"] += 1
+            _dm_latencies.append(time.monotonic() - queued_at)
+        else:
+            dm_stats["fallback"] += 1
+            _dm_fallbacks.append(fallback)
+        if pending:
+            _dm_queue.put_nowait(user_id)
+        else:
+            del _dm_pending[user_id]
+        _dm_queue.task_done()
+
+def start_dm_workers():
+    if not _dm_workers:
+        _dm_workers.extend(asyncio.create_task(_dm_worker()) for _ in range(DM_WORKERS))
+    if not flush_dm_fallbacks.is_running():
+        flush_dm_fallbacks.start()
+
+@tasks.loop(seconds=DM_FALLBACK_INTERVAL_SECONDS)
+async def flush_dm_fallbacks():
+    if not _dm_fallbacks:
+        return
+    lines = _dm_fallbacks[:]
+    _dm_fallbacks.clear()
+    channel = bot.get_channel(REMINDER_CHANNEL_ID)
+    chunk = ""
+    try:
+        for line in lines:
+            if chunk and len(chunk) + len(line) + 1 > 2000:
+                await channel.send(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n{line}" if chunk else line[:2000]
+        if chunk:
+            await channel.send(chunk)
+    except Exception as e:
+        dm_stats["failed"] += len(lines)
+        print(f"DM fallback post failed: {e}")
+
+# =============================
+# Channel send queue
+# =============================
+# Game messages go through a per-channel queue that tracks Discord's budget of about
+# 5 messages per 5 seconds per channel. While the budget lasts messages go out one
+# by one; once more are queued than the budget allows, the pending ones are merged
+# into a single message (contents joined, up to 10 embeds). Messages with a view
+# and edits of earlier messages are always sent on their own, but still count
+# against the budget.
+CHANNEL_SEND_BURST = 5
+CHANNEL_SEND_WINDOW_SECONDS = 5
+_channel_queues = {}
+_channel_sends = {}
+_channel_senders = {}
+channel_send_stats = {"queued": 0, "sent": 0, "coalesced": 0}
+
+def queue_channel_send(channel, content=None, embed=None, view=None, edit=None):
+    # Returns a future for the sent message; await it to keep ordering with later sends.
+    # edit: a message in channel to edit instead of sending a new one.
+    future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _channel_queues.setdefault(channel.id, deque()).append((content, embed, view, future, edit))
+    channel_send_stats["queued"] += 1
+    if channel.id not in _channel_senders:
+        _channel_senders[channel.id] = asyncio.create_task(_channel_sender(channel))
+    return future
+
+def _take_batch(queue, budget):
+    content, embed, view, future, edit = queue.popleft()
+    batch = [future]
+    contents = [content] if content else []
+    embeds = [embed] if embed else []
+    if view is None and edit is None and len(queue) >= budget:
+        while queue and queue[0][2] is None and queue[0][4] is None:
+            next_content, next_embed, _, next_future, _ = queue[0]
+            # Embeds render below the text, so text can't follow an embed in a merged message.
+            if next_content and embeds or len("\n".join(contents + [next_content or ""])) > 2000 or len(embeds) + bool(next_embed) > 10:
+                break
+            queue.popleft()
+            batch.append(next_future)
+            if next_content:
+                contents.append(next_content)
+            if next_embed:
+                embeds.append(next_embed)
+    return batch, "\n".join(contents) or None, embeds, view, edit
+
+async def _channel_sender(channel):
+    queue = _channel_queues[channel.id]
+    sent = _channel_sends.setdefault(channel.id, deque())
+    try:
+        while queue:
+            now = time.monotonic()
+            while sent and sent[0] <= now - CHANNEL_SEND_WINDOW_SECONDS:
+                sent.popleft()
+            if len(sent) >= CHANNEL_SEND_BURST:
+                await asyncio.sleep(sent[0] + CHANNEL_SEND_WINDOW_SECONDS - now)
+                continue
+            batch, content, embeds, view, edit = _take_batch(queue, CHANNEL_SEND_BURST - len(sent))
+            sent.append(now)
+            kwargs = {"view": view} if view else {}
+            if embeds:
+                kwargs["embeds"] = embeds
+            try:
+                message = await (edit.edit(content=content, **kwargs) if edit else channel.send(content=content, **kwargs))
+            except Exception as e:
+                print(f"Send to channel {channel.id} failed: {e}")
+                for future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            channel_send_stats["sent"] += 1
+            channel_send_stats["coalesced"] += len(batch) - 1
+            for future in batch:
+                if not future.done():
+                    future.set_result(message)
+    finally:
+        del _channel_senders[channel.id]
+        if not queue:
+            del _channel_queues[channel.id]
+            # The last send is still inside the window, so drop the timestamps once it has
+            # passed; otherwise every short-lived duel thread would leave an entry behind.
+            asyncio.get_running_loop().call_later(CHANNEL_SEND_WINDOW_SECONDS, _forget_channel_sends, channel.id)
+
+def _forget_channel_sends(channel_id):
+    sent = _channel_sends.get(channel_id)
+    if sent is None or channel_id in _channel_senders:
+        return
+    now = time.monotonic()
+    while sent and sent[0] <= now - CHANNEL_SEND_WINDOW_SECONDS:
+        sent.popleft()
+    if sent:
+        asyncio.get_running_loop().call_later(sent[0] + CHANNEL_SEND_WINDOW_SECONDS - now, _forget_channel_sends, channel_id)
+    else:
+        del _channel_sends[channel_id]
+
+# =============================
+# User cache
+# =============================
+# Users and members are looked up in the gateway cache first, then in a small
+# TTL/LRU cache of REST results. Concurrent lookups for the same id share one
+# request; batches are resolved in parallel.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "600"))
+_user_cache = OrderedDict()
+_user_lookups = {}
+user_cache_stats = {"gateway_hits": 0, "hits": 0, "misses": 0, "shared": 0}
+
+async def _fetch_user(key):
+    guild_id, user_id = key
+    try:
+        if guild_id:
+            guild = bot.get_guild(guild_id)
+            return await guild.fetch_member(user_id) if guild else None
+        return await bot.fetch_user(user_id)
+    except discord.NotFound:
+        return None
+
+async def resolve_user(user_id, guild=None):
+    # A Member when guild is given, otherwise a User; None if Discord doesn't know the id.
+    user_id = int(user_id)
+    cached = guild.get_member(user_id) if guild else bot.get_user(user_id)
+    if cached:
+        user_cache_stats["gateway_hits"] += 1
+        return cached
+    key = (guild.id if guild else 0, user_id)
+    entry = _user_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        _user_cache.move_to_end(key)
+        user_cache_stats["hits"] += 1
+        return entry[1]
+    if key in _user_lookups:
+        user_cache_stats["shared"] += 1
+        return await asyncio.shield(_user_lookups[key])
+    user_cache_stats["misses"] += 1
+    lookup = asyncio.ensure_future(_fetch_user(key))
+    _user_lookups[key] = lookup
+    try:
+        user = await asyncio.shield(lookup)
+    finally:
+        _user_lookups.pop(key, None)
+    _user_cache[key] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+    _user_cache.move_to_end(key)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+    return user
+
+async def resolve_users(user_ids, guild=None):
+    return await asyncio.gather(*(resolve_user(uid, guild) for uid in user_ids))
 
 # =============================
 # Gamification setup
 # =============================
 CATEGORY_BONUSES = {"cybersecurity": 2, "blender": 2, "webdev": 1, "blockchain": 3, "general": 0}
 
+# Rankings are kept up to date as points change instead of sorting progress_data on
+# every /leaderboard: one board for total points and one per category. Call
+# update_rankings for every user whose points or category_points changed.
+rankings = {None: RankIndex()}
+
+def update_rankings(*user_ids):
+    for user_id in user_ids:
+        data = progress_data.get(user_id)
+        if data is None:
+            for board in rankings.values():
+                board.remove(user_id)
+            continue
+        rankings[None].update(user_id, data["points"])
+        for category, points in data["category_points"].items():
+            rankings.setdefault(category, RankIndex()).update(user_id, points)
+
+def top_users_by_points(limit, category=None):
+    board = rankings.get(category)
+    if not board:
+        return []
+    return [(uid, progress_data[uid], points) for uid, points in board.top(limit)]
+
+def user_rank(user_id, category=None):
+    board = rankings.get(category)
+    return (board.rank(user_id), len(board)) if board and user_id in board else (None, 0)
+
+update_rankings(*progress_data)
+
+# Rendered /leaderboard embeds keyed by (limit, category). An entry is reused while
+# its board's version is unchanged; when the version moves, the top K rows are
+# compared and the embed is rebuilt only if they differ. The TTL picks up renamed
+# users and streak changes.
+LEADERBOARD_CACHE_TTL_SECONDS = float(os.getenv("LEADERBOARD_CACHE_TTL_SECONDS", "60"))
+_leaderboard_cache = {}
+leaderboard_cache_stats = {"hits": 0, "misses": 0}
+
+# (role name, points required, "general" for total points or the category counted)
+ROLE_THRESHOLDS = [
+    ("Cyber Pro", 1000, "general"),
+    ("Blender Guru", 2000, "blender"),
+    ("Web Dev Wizard", 3000, "webdev"),
+    ("Blockchain Master", 5000, "blockchain"),
+    ("NFT Pioneer", 3000, "blockchain")
+]
+THRESHOLD_ROLE_NAMES = {name for name, _, _ in ROLE_THRESHOLDS}
+# guild id -> {role name: Role} for the threshold roles, dropped when one of them changes.
+_guild_roles = {}
+_guild_role_locks = {}
+
+async def _threshold_role(guild, name):
+    roles = _guild_roles.get(guild.id)
+    if roles is None:
+        roles = _guild_roles[guild.id] = {r.name: r for r in guild.roles if r.name in THRESHOLD_ROLE_NAMES}
+    if name not in roles:
+        async with _guild_role_locks.setdefault(guild.id, asyncio.Lock()):
+            if name not in roles:
+                roles[name] = await guild.create_role(name=name)
+    return roles[name]
+
 async def check_roles(user):
+    # Grants every threshold role the user has newly reached, in one add_roles call.
     user_id = str(user.id)
-    points = progress_data[user_id]["points"]
-    cat_points = progress_data[user_id]["category_points"]
-    roles_assigned = progress_data[user_id]["roles_assigned"]
-    guild = user.guild
-    role_thresholds = [
-        {"name": "Cyber Pro", "points": 1000, "type": "general"},
-        {"name": "Blender Guru", "points": 2000, "type": "blender"},
-        {"name": "Web Dev Wizard", "points": 3000, "type": "webdev"},
-        {"name": "Blockchain Master", "points": 5000, "type": "blockchain"},
-        {"name": "NFT Pioneer", "points": 3000, "type": "blockchain"}
+    data = progress_data[user_id]
+    reached = [
+        name for name, req_points, kind in ROLE_THRESHOLDS
+        if name not in data["roles_assigned"] and (data["points"] if kind == "general" else data["category_points"].get(kind, 0)) >= req_points
     ]
-    for role_info in role_thresholds:
-        role = discord.utils.get(guild.roles, name=role_info["name"])
-        if not role:
-            role = await guild.create_role(name=role_info["name"])
-        req_points = role_info["points"]
-        if role_info["type"] == "general":
-            if points >= req_points and role_info["name"] not in roles_assigned:
-                await user.add_roles(role)
-                roles_assigned.append(role_info["name"])
-        else:
-            if cat_points.get(role_info["type"], 0) >= req_points and role_info["name"] not in roles_assigned:
-                await user.add_roles(role)
-                roles_assigned.append(role_info["name"])
-        progress_data[user_id]["roles_assigned"] = roles_assigned
-    save_json(PROGRESS_FILE, progress_data)
+    if not reached:
+        return
+    roles = [await _threshold_role(user.guild, name) for name in reached]
+    await user.add_roles(*roles)
+    data["roles_assigned"].extend(reached)
+    mark_dirty(PROGRESS_FILE, [user_id])
 
 # =============================
 # Helpers
@@ -147,11 +1087,53 @@ async def on_member_join(member):
     )
     await channel.send(embed=embed)
 
+# =============================
+# Chat reply waiters
+# =============================
+# Games waiting on a chat reply register here instead of using bot.wait_for, which
+# would run every waiter's check against every message. on_message resolves a
+# waiter with one dict lookup and skips the lookup entirely in channels with no
+# pending waiters.
+_message_waiters = {}
+_waiting_channels = {}
+
+def _is_answer(content):
+    return content.isdigit() and 1 <= int(content) <= 4
+
+def _is_accept_reply(content):
+    return content.lower() in ["accept", "decline"]
+
+async def wait_for_message(channel_id, author_ids, accept, timeout):
+    # Next message in channel_id from any of author_ids whose content passes accept.
+    future = asyncio.get_running_loop().create_future()
+    keys = [(channel_id, author_id) for author_id in author_ids]
+    for key in keys:
+        _message_waiters[key] = (future, accept)
+    _waiting_channels[channel_id] = _waiting_channels.get(channel_id, 0) + len(keys)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    finally:
+        for key in keys:
+            if _message_waiters.get(key, (None,))[0] is future:
+                del _message_waiters[key]
+        _waiting_channels[channel_id] -= len(keys)
+        if _waiting_channels[channel_id] <= 0:
+            del _waiting_channels[channel_id]
+
+def _resolve_waiter(message):
+    waiter = _message_waiters.get((message.channel.id, message.author.id))
+    if waiter and not waiter[0].done() and waiter[1](message.content):
+        waiter[0].set_result(message)
+        return True
+    return False
+
 # =============================
 # Grant Full Access on Introduction
 # =============================
 @bot.event
 async def on_message(message):
+    if message.channel.id in _waiting_channels and _resolve_waiter(message):
+        return
     intro_channel_id = 1416866081683013752
     full_access_role_name = "Full Access"
     if message.channel.id == intro_channel_id and not message.author.bot:
@@ -162,40 +1144,78 @@ async def on_message(message):
         if role not in message.author.roles:
             await message.author.add_roles(role)
             await message.channel.send(f"✅ {message.author.mention}, you now have full access! Welcome!")
-    await bot.process_commands(message)
+    if message.content.startswith(bot.command_prefix):
+        await bot.process_commands(message)
 
 # =============================
 # Resource Commands
 # =============================
+# One inverted index per topic over title, tags and description; doc ids are list positions.
+RESOURCES_PER_PAGE = 5
+resource_indexes = {}
+
+def index_resource(topic, i):
+    r = resources[topic][i]
+    resource_indexes.setdefault(topic, InvertedIndex()).add(i, title=r["title"], tags=r.get("tags", []), description=r.get("description", ""))
+
+def _resource_boost(r):
+    return (2 if r.get("featured") else 0) + 0.1 * (r.get("upvotes", 0) - r.get("downvotes", 0))
+
+def search_resources(topic, search=None):
+    # Resources of topic matching search, best first.
+    topic_resources = resources[topic]
+    if not search:
+        return sorted(topic_resources, key=_resource_boost, reverse=True)
+    scores = resource_indexes[topic].search(search) if topic in resource_indexes else {}
+    return [topic_resources[i] for i in sorted(scores, key=lambda i: scores[i] + _resource_boost(topic_resources[i]), reverse=True)]
+
+for _topic in resources:
+    for _i in range(len(resources[_topic])):
+        index_resource(_topic, _i)
+
 @tree.command(name="resource", description="Get learning resources by topic")
-@app_commands.describe(topic="Topic: cybersecurity, blender, webdev, blockchain, general", search="Optional search term")
-async def resource(interaction: discord.Interaction, topic: str, search: str = None):
+@app_commands.describe(topic="Topic: cybersecurity, blender, webdev, blockchain, general", search="Optional search term", page="Results page")
+async def resource(interaction: discord.Interaction, topic: str, search: str = None, page: int = 1):
     if topic.lower() not in resources:
         await interaction.response.send_message("❌ Invalid topic. Try: cybersecurity, blender, webdev, blockchain, general.", ephemeral=True)
         return
-    filtered = resources[topic.lower()]
-    if search:
-        filtered = [r for r in filtered if search.lower() in r["title"].lower()]
+    filtered = search_resources(topic.lower(), search)
     if not filtered:
         await interaction.response.send_message(f"❌ No resources found for {topic}.", ephemeral=True)
         return
+    pages = (len(filtered) + RESOURCES_PER_PAGE - 1) // RESOURCES_PER_PAGE
+    page = min(max(page, 1), pages)
     embed = discord.Embed(title=f"📚 {topic.title()} Resources", color=0x00FF00)
-    for r in filtered[:5]:
-        embed.add_field(name=r["title"], value=f"[Link]({r['url']})", inline=False)
+    for r in filtered[(page - 1) * RESOURCES_PER_PAGE:page * RESOURCES_PER_PAGE]:
+        embed.add_field(name=r["title"], value=f"[Link]({r['url']})" + (f"\n{r['description']}" if r.get("description") else ""), inline=False)
     featured = next((r for r in filtered if r.get("featured")), None)
     if featured:
         embed.add_field(name="🌟 Featured", value=f"{featured['title']}: [Link]({featured['url']})", inline=False)
+    embed.set_footer(text=f"Page {page}/{pages} | {len(filtered)} results")
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@resource.autocomplete("search")
+async def resource_search_autocomplete(interaction: discord.Interaction, current: str):
+    topic = (interaction.namespace.topic or "").lower()
+    if topic not in resources:
+        return []
+    return [app_commands.Choice(name=r["title"][:100], value=r["title"][:100]) for r in search_resources(topic, current)[:25]]
+
 @tree.command(name="resource_add", description="Add a resource (mod only)")
 @is_mod()
-@app_commands.describe(topic="Topic: cybersecurity, blender, webdev, blockchain, general", title="Resource title", url="Resource URL", featured="Mark as featured? (true/false)")
-async def resource_add(interaction: discord.Interaction, topic: str, title: str, url: str, featured: bool = False):
+@app_commands.describe(topic="Topic: cybersecurity, blender, webdev, blockchain, general", title="Resource title", url="Resource URL", featured="Mark as featured? (true/false)", tags="Comma-separated tags (optional)", description="Short description (optional)")
+async def resource_add(interaction: discord.Interaction, topic: str, title: str, url: str, featured: bool = False, tags: str = None, description: str = None):
     if topic.lower() not in resources:
         await interaction.response.send_message("❌ Invalid topic.", ephemeral=True)
         return
-    resources[topic.lower()].append({"title": title, "url": url, "featured": featured, "upvotes": 0, "downvotes": 0})
-    save_json(RESOURCES_FILE, resources)
+    entry = {"title": title, "url": url, "featured": featured, "upvotes": 0, "downvotes": 0}
+    if tags:
+        entry["tags"] = [t.strip().lower() for t in tags.split(",") if t.strip()]
+    if description:
+        entry["description"] = description
+    resources[topic.lower()].append(entry)
+    index_resource(topic.lower(), len(resources[topic.lower()]) - 1)
+    mark_dirty(RESOURCES_FILE, [topic.lower()])
     channel = bot.get_channel(ANNOUNCEMENT_CHANNEL_ID)
     await channel.send(f"📢 New {topic} resource: **{title}** [Link]({url})" + (" 🌟 (Featured)" if featured else ""))
     await interaction.response.send_message(f"✅ Added {title} to {topic} resources.", ephemeral=True)
@@ -221,15 +1241,17 @@ async def submit_project(interaction: discord.Interaction, title: str, descripti
         "category": category.lower()
     }
     projects.append(project)
-    save_json(PROJECTS_FILE, projects)
+    i = len(projects) - 1
+    mark_dirty(PROJECTS_FILE, [i])
     channel = bot.get_channel(ANNOUNCEMENT_CHANNEL_ID)
     embed = discord.Embed(title=f"🚀 New Project: {title}", description=description, color=0xFFD700)
     if link:
         embed.add_field(name="Link", value=f"[Click here]({link})", inline=False)
     if image:
         embed.set_image(url=image.url)
-    embed.set_footer(text=f"Submitted by {interaction.user.name} | React with 👍 to upvote!")
+    embed.set_footer(text=f"Submitted by {interaction.user.name} | React with 👍 to upvote! | {project['timestamp']}")
     message = await channel.send(embed=embed)
+    track_project_message(i, message.id)
     await message.add_reaction("👍")
     user_id = str(interaction.user.id)
     progress_data.setdefault(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
@@ -247,40 +1269,110 @@ async def submit_project(interaction: discord.Interaction, title: str, descripti
     if challenges["current"] and challenges["date"] == today and challenges["current"]["type"] == "project_guru" and category.lower() == challenges["current"]["requirements"]["category"]:
         challenges["user_progress"].setdefault(user_id, {})
         challenges["user_progress"][user_id]["project_submitted"] = True
-    save_json(CHALLENGES_FILE, challenges)
-    save_json(PROGRESS_FILE, progress_data)
+    mark_dirty(CHALLENGES_FILE, [("user_progress", user_id)])
+    mark_dirty(PROGRESS_FILE, [user_id])
+    update_rankings(user_id)
     await check_roles(interaction.user)
     await interaction.response.send_message(f"✅ Project submitted! (+{points} points)", ephemeral=True)
 
 @bot.event
-async def on_reaction_add(reaction, user):
-    if user == bot.user:
+async def on_guild_role_create(role):
+    if role.name in THRESHOLD_ROLE_NAMES:
+        _guild_roles.pop(role.guild.id, None)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if before.name in THRESHOLD_ROLE_NAMES or after.name in THRESHOLD_ROLE_NAMES:
+        _guild_roles.pop(after.guild.id, None)
+
+@bot.event
+async def on_guild_role_delete(role):
+    if role.name in THRESHOLD_ROLE_NAMES:
+        _guild_roles.pop(role.guild.id, None)
+
+async def _project_for_payload(payload):
+    # Index of the project announced in payload's message, or None. Only a bot
+    # message in the announcement channel old enough to be a legacy project post is
+    # ever fetched, and each one at most once.
+    i = _project_by_message.get(payload.message_id)
+    if (
+        i is not None or not _legacy_projects
+        or payload.channel_id != ANNOUNCEMENT_CHANNEL_ID
+        or getattr(payload, "message_author_id", None) not in (None, bot.user.id)
+        or discord.utils.snowflake_time(payload.message_id).timestamp() > _legacy_cutoff
+        or payload.message_id in _untracked_messages
+    ):
+        return i
+    try:
+        message = await bot.get_channel(payload.channel_id).fetch_message(payload.message_id)
+    except discord.HTTPException:
+        return None
+    i = find_project_index(message) if message.author == bot.user else None
+    if i is None:
+        _untracked_messages[payload.message_id] = True
+        if len(_untracked_messages) > UNTRACKED_MESSAGES_MAX:
+            _untracked_messages.popitem(last=False)
+    return i
+
+def _set_project_vote(i, user_id, voted):
+    # Returns True if the user's vote changed. Voters are kept per project in
+    # project_votes ({project index: {user_id: true}}), so a vote logs one nested
+    # entry instead of rewriting the project with its voter list.
+    voters = project_votes.setdefault(str(i), {})
+    if (user_id in voters) == voted:
+        return False
+    if voted:
+        voters[user_id] = True
+    else:
+        del voters[user_id]
+    mark_dirty(PROJECT_VOTES_FILE, [(str(i), user_id)])
+    p = projects[i]
+    p["upvotes"] = max(0, p["upvotes"] + (1 if voted else -1))
+    mark_dirty(PROJECTS_FILE, [i])
+    return True
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    if str(payload.emoji) != "👍" or payload.user_id == bot.user.id:
         return
-    message = reaction.message
-    if message.author == bot.user and reaction.emoji == "👍":
-        embed = message.embeds[0] if message.embeds else None
-        if not embed:
-            return
-        today = datetime.now().strftime("%Y-%m-%d")
-        user_id = str(user.id)
-        progress_data.setdefault(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
-        for p in projects:
-            if p["timestamp"] in embed.footer.text:
-                p["upvotes"] += 1
-                save_json(PROJECTS_FILE, projects)
-                if challenges["current"] and challenges["date"] == today and challenges["current"]["type"] == "project_guru" and p["category"] == challenges["current"]["requirements"]["category"]:
-                    proj_user_id = p["user_id"]
-                    challenges["user_progress"].setdefault(proj_user_id, {})
-                    challenges["user_progress"][proj_user_id]["upvotes"] = p["upvotes"]
-                    if p["upvotes"] >= challenges["current"]["requirements"]["upvotes"]:
-                        progress_data[proj_user_id]["points"] += challenges["current"]["points"]
-                        progress_data[proj_user_id]["category_points"].setdefault(p["category"], 0)
-                        progress_data[proj_user_id]["category_points"][p["category"]] += challenges["current"]["points"]
-                        await bot.get_channel(ANNOUNCEMENT_CHANNEL_ID).send(f"🎉 <@{proj_user_id}> completed daily challenge! +{challenges['current']['points']} points")
-                    save_json(CHALLENGES_FILE, challenges)
-                    save_json(PROGRESS_FILE, progress_data)
-                    await check_roles(await bot.fetch_user(int(proj_user_id)))
-                break
+    i = await _project_for_payload(payload)
+    if i is None or not _set_project_vote(i, str(payload.user_id), True):
+        return
+    today = datetime.now().strftime("%Y-%m-%d")
+    user_id = str(payload.user_id)
+    progress_data.setdefault(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
+    p = projects[i]
+    if challenges["current"] and challenges["date"] == today and challenges["current"]["type"] == "project_guru" and p["category"] == challenges["current"]["requirements"]["category"]:
+        proj_user_id = p["user_id"]
+        challenges["user_progress"].setdefault(proj_user_id, {})
+        challenges["user_progress"][proj_user_id]["upvotes"] = p["upvotes"]
+        # Votes can be withdrawn and re-added, so the reward is paid once per challenge.
+        if p["upvotes"] >= challenges["current"]["requirements"]["upvotes"] and not challenges["user_progress"][proj_user_id].get("completed"):
+            challenges["user_progress"][proj_user_id]["completed"] = True
+            progress_data.setdefault(proj_user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
+            progress_data[proj_user_id]["points"] += challenges["current"]["points"]
+            progress_data[proj_user_id]["category_points"].setdefault(p["category"], 0)
+            progress_data[proj_user_id]["category_points"][p["category"]] += challenges["current"]["points"]
+            await bot.get_channel(ANNOUNCEMENT_CHANNEL_ID).send(f"🎉 <@{proj_user_id}> completed daily challenge! +{challenges['current']['points']} points")
+            mark_dirty(PROGRESS_FILE, [proj_user_id])
+            update_rankings(proj_user_id)
+            guild = bot.get_guild(payload.guild_id) if payload.guild_id else None
+            member = await resolve_user(proj_user_id, guild) if guild else None
+            if member:
+                await check_roles(member)
+        mark_dirty(CHALLENGES_FILE, [("user_progress", proj_user_id)])
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    if str(payload.emoji) != "👍" or payload.message_id not in _project_by_message:
+        return
+    i = _project_by_message[payload.message_id]
+    if _set_project_vote(i, str(payload.user_id), False):
+        p = projects[i]
+        progress = challenges["user_progress"].get(p["user_id"])
+        if progress and "upvotes" in progress and challenges["date"] == datetime.now().strftime("%Y-%m-%d"):
+            progress["upvotes"] = p["upvotes"]
+            mark_dirty(CHALLENGES_FILE, [("user_progress", p["user_id"])])
 
 # =============================
 # To-Do Commands
@@ -294,7 +1386,7 @@ async def todo_add(interaction: discord.Interaction, task: str, category: str =
         return
     if due_date:
         try:
-            datetime.strptime(due_date, "%Y-%m-%d")
+            due_date = normalize_due_date(due_date)
         except ValueError:
             await interaction.response.send_message("❌ Invalid due date format. Use YYYY-MM-DD.", ephemeral=True)
             return
@@ -307,7 +1399,8 @@ async def todo_add(interaction: discord.Interaction, task: str, category: str =
         "progress": "not_started",
         "notes": ""
     })
-    save_json(TASKS_FILE, tasks_data)
+    index_task_due(user_id, len(tasks_data[user_id]) - 1)
+    mark_dirty(TASKS_FILE, [user_id])
     await interaction.response.send_message(f"📝 Task added: {task} ({category})" + (f", due {due_date}" if due_date else ""), ephemeral=True)
 
 @tree.command(name="todo_add_user", description="Assign a task with category and due date (mod only)")
@@ -320,7 +1413,7 @@ async def todo_add_user(interaction: discord.Interaction, user: discord.Member,
         return
     if due_date:
         try:
-            datetime.strptime(due_date, "%Y-%m-%d")
+            due_date = normalize_due_date(due_date)
         except ValueError:
             await interaction.response.send_message("❌ Invalid due date format.", ephemeral=True)
             return
@@ -333,12 +1426,10 @@ async def todo_add_user(interaction: discord.Interaction, user: discord.Member,
         "progress": "not_started",
         "notes": ""
     })
-    save_json(TASKS_FILE, tasks_data)
-    try:
-        await user.send(f"👾 Task assigned: {task} ({category})" + (f", due {due_date}" if due_date else ""))
-    except:
-        channel = bot.get_channel(REMINDER_CHANNEL_ID)
-        await channel.send(f"👾 {user.mention}, Task assigned: {task} ({category})" + (f", due {due_date}" if due_date else ""))
+    index_task_due(user_id, len(tasks_data[user_id]) - 1)
+    mark_dirty(TASKS_FILE, [user_id])
+    due = f", due {due_date}" if due_date else ""
+    send_dm(user.id, f"👾 Task assigned: {task} ({category}){due}", f"👾 {user.mention}, Task assigned: {task} ({category}){due}")
     await interaction.response.send_message(f"✅ Task assigned to {user.mention}: {task}")
 
 @tree.command(name="todo_update", description="Update task progress or notes")
@@ -353,7 +1444,7 @@ async def todo_update(interaction: discord.Interaction, task_number: int, progre
         task["progress"] = progress.lower()
     if notes:
         task["notes"] = notes
-    save_json(TASKS_FILE, tasks_data)
+    mark_dirty(TASKS_FILE, [user_id])
     await interaction.response.send_message(f"✅ Updated task {task_number}: {task['task']}", ephemeral=True)
 
 @tree.command(name="todo_list", description="List your tasks")
@@ -402,12 +1493,13 @@ async def todo_complete(interaction: discord.Interaction, number: int):
         await interaction.response.send_message("❌ Invalid task number.", ephemeral=True)
         return
     task = tasks_data[user_id][number - 1]
+    unindex_task_due(user_id, number - 1)
     tasks_data[user_id][number - 1]["completed"] = True
     reminder_key = f"{user_id}_{number}"
     if reminder_key in reminders:
         del reminders[reminder_key]
-        save_json(REMINDERS_FILE, reminders)
-    save_json(TASKS_FILE, tasks_data)
+        mark_dirty(REMINDERS_FILE, [reminder_key])
+    mark_dirty(TASKS_FILE, [user_id])
     points = 5 + CATEGORY_BONUSES.get(task["category"], 0)
     progress_data.setdefault(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
     progress_data[user_id]["points"] += points
@@ -420,7 +1512,8 @@ async def todo_complete(interaction: discord.Interaction, number: int):
     if progress_data[user_id]["streak"] > 2:
         points = int(points * 1.5)
         progress_data[user_id]["points"] = int(progress_data[user_id]["points"] * 1.5)
-    save_json(PROGRESS_FILE, progress_data)
+    mark_dirty(PROGRESS_FILE, [user_id])
+    update_rankings(user_id)
     await check_roles(interaction.user)
     await interaction.response.send_message(f"✅ Task completed: {task['task']} (+{points} points, Streak: {progress_data[user_id]['streak']})")
 
@@ -428,9 +1521,11 @@ async def todo_complete(interaction: discord.Interaction, number: int):
 @is_mod()
 async def todo_clear(interaction: discord.Interaction):
     tasks_data.clear()
+    _due_index.clear()
     reminders.clear()
-    save_json(TASKS_FILE, tasks_data)
-    save_json(REMINDERS_FILE, reminders)
+    _reminder_heap.clear()
+    mark_dirty(TASKS_FILE)
+    mark_dirty(REMINDERS_FILE)
     await interaction.response.send_message("🗑️ All tasks and reminders cleared!")
 
 # =============================
@@ -466,7 +1561,8 @@ async def remind(interaction: discord.Interaction, task_number: int = 0, message
         "last_reminder": "2020-01-01T00:00:00",
         "task_number": task_number
     }
-    save_json(REMINDERS_FILE, reminders)
+    mark_dirty(REMINDERS_FILE, [reminder_key])
+    schedule_reminder(reminder_key)
     await interaction.response.send_message(f"🔔 Reminder set for: {task} ({interval})", ephemeral=True)
 
 @tree.command(name="remind_user", description="Set a reminder for another user’s task (mod only)")
@@ -498,53 +1594,87 @@ async def remind_user(interaction: discord.Interaction, user: discord.Member, ta
         "last_reminder": "2020-01-01T00:00:00",
         "task_number": task_number
     }
-    save_json(REMINDERS_FILE, reminders)
-    try:
-        await user.send(f"🔔 Reminder set: {task} ({interval})")
-    except:
-        channel = bot.get_channel(REMINDER_CHANNEL_ID)
-        await channel.send(f"🔔 {user.mention}, Reminder set: {task} ({interval})")
+    mark_dirty(REMINDERS_FILE, [reminder_key])
+    schedule_reminder(reminder_key)
+    send_dm(user.id, f"🔔 Reminder set: {task} ({interval})", f"🔔 {user.mention}, Reminder set: {task} ({interval})")
     await interaction.response.send_message(f"✅ Reminder set for {user.mention}: {task}")
 
-@tasks.loop(minutes=15)
+# Reminders sit in a min-heap keyed on their next due time; send_reminders sleeps
+# until the earliest one (or until a new reminder is scheduled ahead of it), queues
+# everything due for DM delivery and marks the batch dirty once. Heap entries carry a
+# version so rescheduled or deleted reminders are skipped when popped.
+REMINDER_INTERVALS = {"30min": 30, "2hours": 120, "daily": 1440}
+REMINDER_RETRY_SECONDS = 60
+_reminder_heap = []
+_reminder_versions = {}
+_reminder_wakeup = asyncio.Event()
+
+def schedule_reminder(reminder_key, retry=False):
+    # retry: try again in REMINDER_RETRY_SECONDS instead of at the next interval.
+    data = reminders.get(reminder_key)
+    if not data or data["reminder_count"] >= data["max_reminders"]:
+        return
+    if retry:
+        due = time.time() + REMINDER_RETRY_SECONDS
+    else:
+        due = (datetime.fromisoformat(data["last_reminder"]) + timedelta(minutes=REMINDER_INTERVALS[data["interval"]])).timestamp()
+    version = _reminder_versions.get(reminder_key, 0) + 1
+    _reminder_versions[reminder_key] = version
+    heapq.heappush(_reminder_heap, (due, version, reminder_key))
+    if _reminder_heap[0][2] == reminder_key:
+        _reminder_wakeup.set()
+
+def _deliver_reminder(reminder_key):
+    data = reminders[reminder_key]
+    user_id = data["user_id"]
+    if data["task_number"] > 0 and user_id in tasks_data and data["task_number"] <= len(tasks_data[user_id]):
+        if tasks_data[user_id][data["task_number"] - 1]["completed"]:
+            del reminders[reminder_key]
+            return
+    send_dm(user_id, f"⏰ Reminder: {data['task']}", f"⏰ <@{user_id}>, Reminder: {data['task']}")
+    data["reminder_count"] += 1
+    data["last_reminder"] = datetime.now().isoformat()
+    schedule_reminder(reminder_key)
+
+@tasks.loop(seconds=0)
 async def send_reminders():
-    now = datetime.now()
-    for reminder_key, data in reminders.copy().items():
-        if data["reminder_count"] >= data["max_reminders"]:
-            continue
-        user_id = data["user_id"]
-        if data["task_number"] > 0 and user_id in tasks_data and data["task_number"] <= len(tasks_data[user_id]):
-            if tasks_data[user_id][data["task_number"] - 1]["completed"]:
-                del reminders[reminder_key]
-                save_json(REMINDERS_FILE, reminders)
-                continue
-        last_reminder = datetime.fromisoformat(data["last_reminder"])
-        interval_minutes = {"30min": 30, "2hours": 120, "daily": 1440}
-        if (now - last_reminder).total_seconds() / 60 >= interval_minutes[data["interval"]]:
-            user = await bot.fetch_user(int(user_id))
+    now = time.time()
+    due = []
+    while _reminder_heap and _reminder_heap[0][0] <= now:
+        _, version, reminder_key = heapq.heappop(_reminder_heap)
+        if reminder_key in reminders and _reminder_versions.get(reminder_key) == version:
+            due.append(reminder_key)
+    if due:
+        for reminder_key in due:
             try:
-                await user.send(f"⏰ Reminder: {data['task']}")
-            except:
-                channel = bot.get_channel(REMINDER_CHANNEL_ID)
-                await channel.send(f"⏰ {user.mention}, Reminder: {data['task']}")
-            data["reminder_count"] += 1
-            data["last_reminder"] = now.isoformat()
-            save_json(REMINDERS_FILE, reminders)
+                _deliver_reminder(reminder_key)
+            except Exception as e:
+                print(f"Reminder {reminder_key} failed: {e}")
+                # Its heap entry is already popped; without this it stays silent until a restart.
+                try:
+                    schedule_reminder(reminder_key, retry=True)
+                except Exception as e:
+                    print(f"Reminder {reminder_key} could not be rescheduled: {e}")
+        mark_dirty(REMINDERS_FILE, due)
+        return
+    _reminder_wakeup.clear()
+    timeout = _reminder_heap[0][0] - now if _reminder_heap else None
+    try:
+        await asyncio.wait_for(_reminder_wakeup.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+@send_reminders.before_loop
+async def build_reminder_schedule():
+    for reminder_key in list(reminders):
+        schedule_reminder(reminder_key)
 
 @tasks.loop(hours=24)
 async def task_due_notifications():
-    now = datetime.now()
-    for user_id, tasks in tasks_data.items():
-        user = await bot.fetch_user(int(user_id))
-        for i, task in enumerate(tasks):
-            if task["due_date"] and not task["completed"]:
-                due = datetime.strptime(task["due_date"], "%Y-%m-%d")
-                if (due - now).days <= 1:
-                    try:
-                        await user.send(f"⏳ Task due soon: {task['task']} (Due: {task['due_date']})")
-                    except:
-                        channel = bot.get_channel(REMINDER_CHANNEL_ID)
-                        await channel.send(f"⏳ {user.mention}, Task due soon: {task['task']} (Due: {task['due_date']})")
+    cutoff = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+    for user_id, i in due_tasks(cutoff):
+        task = tasks_data[user_id][i]
+        send_dm(user_id, f"⏳ Task due soon: {task['task']} (Due: {task['due_date']})", f"⏳ <@{user_id}>, Task due soon: {task['task']} (Due: {task['due_date']})")
 
 # =============================
 # Event Commands
@@ -553,65 +1683,538 @@ async def task_due_notifications():
 # =============================
 # Quiz Commands with OpenRouter
 # =============================
-async def generate_ai_question(category: str, difficulty: str = "medium"):
-    if not client:
-        print("OpenRouter client not initialized. Check OPENROUTER_API_KEY in .env")
-        return None
-    models = [
-        "mistralai/mistral-7b-instruct:free",
-        "deepseek/deepseek-chat-v3.1:free",
-        "deepseek/deepseek-chat-v3-0324:free",
-        "z-ai/glm-4.5-air:free",
-        "mistralai/mistral-small-3.2-24b-instruct:free",
-        "cognitivecomputations/dolphin-mistral-24b-venice-edition:free"
-    ]
-    prompt = (
-        f"You are a quiz master for a tech learning server. Generate a single multiple-choice question (MCQ) on {category}. "
-        f"Make it educational for beginners in Cybersecurity, Blender, Web Dev, Blockchain, or NFTs. "
+QUIZ_MODELS = [
+    "mistralai/mistral-7b-instruct:free",
+    "deepseek/deepseek-chat-v3.1:free",
+    "deepseek/deepseek-chat-v3-0324:free",
+    "z-ai/glm-4.5-air:free",
+    "mistralai/mistral-small-3.2-24b-instruct:free",
+    "cognitivecomputations/dolphin-mistral-24b-venice-edition:free"
+]
+AI_BATCH_MAX = int(os.getenv("AI_BATCH_MAX", "10"))
+
+def _quiz_prompt(category, difficulty, count):
+    if count == 1:
+        return (
+            f"You are a quiz master for a tech learning server. Generate a single multiple-choice question (MCQ) on {category}. "
+            f"Make it educational for beginners in Cybersecurity, Blender, Web Dev, Blockchain, or NFTs. "
+            f"Difficulty: {difficulty}. For blockchain, include NFT-related questions (e.g., Moana NFT minting).\n"
+            "Output ONLY valid JSON in this exact format: "
+            "{ 'question': 'The question text?', 'options': ['1. Option A', '2. Option B', '3. Option C', '4. Option D'], 'answer': 1 }\n"
+            "Rules: 1. Provide exactly 4 options, each starting with its number (e.g., '1. ...'). 2. Only one option is correct. 3. The answer field must be an integer 1-4 matching the correct option. 4. Do not include explanations or any extra text. 5. Output only valid JSON, no markdown or commentary."
+        )
+    return (
+        f"You are a quiz master for a tech learning server. Generate {count} different multiple-choice questions (MCQs) on {category}. "
+        f"Make them educational for beginners in Cybersecurity, Blender, Web Dev, Blockchain, or NFTs. "
         f"Difficulty: {difficulty}. For blockchain, include NFT-related questions (e.g., Moana NFT minting).\n"
-        "Output ONLY valid JSON in this exact format: "
-        "{ 'question': 'The question text?', 'options': ['1. Option A', '2. Option B', '3. Option C', '4. Option D'], 'answer': 1 }\n"
-        "Rules: 1. Provide exactly 4 options, each starting with its number (e.g., '1. ...'). 2. Only one option is correct. 3. The answer field must be an integer 1-4 matching the correct option. 4. Do not include explanations or any extra text. 5. Output only valid JSON, no markdown or commentary."
+        "Output ONLY a valid JSON array in this exact format: "
+        "[{ 'question': 'The question text?', 'options': ['1. Option A', '2. Option B', '3. Option C', '4. Option D'], 'answer': 1 }, ...]\n"
+        "Rules: 1. Each question has exactly 4 options, each starting with its number (e.g., '1. ...'). 2. Only one option is correct. 3. The answer field must be an integer 1-4 matching the correct option. 4. Every question must test a different fact. 5. Do not include explanations or any extra text. 6. Output only valid JSON, no markdown or commentary."
     )
-    for model in models:
+
+def _parse_ai_json(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
         try:
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model=model,
-                messages=[
+            return json.loads(text.replace("'", '"'))
+        except json.JSONDecodeError:
+            return None
+
+def _valid_question(q):
+    return isinstance(q, dict) and all(k in q for k in ["question", "options", "answer"]) and isinstance(q["question"], str) and isinstance(q["options"], list) and len(q["options"]) == 4 and q["answer"] in [1, 2, 3, 4]
+
+async def _generate_quiz_items(category, difficulty, count):
+    # One completion for `count` questions; returns the valid, distinct ones (or None).
+    prompt = _quiz_prompt(category, difficulty, count)
+    request = f"Generate a question for: {category}. Difficulty: {difficulty}." if count == 1 else f"Generate {count} questions for: {category}. Difficulty: {difficulty}."
+    async def attempt(model):
+        start = time.monotonic()
+        try:
+            generated_text = await chat_completion(
+                model,
+                [
                     {"role": "system", "content": prompt},
-                    {"role": "user", "content": f"Generate a question for: {category}. Difficulty: {difficulty}."}
+                    {"role": "user", "content": request}
                 ],
-                max_tokens=200,
-                temperature=0.7
+                max_tokens=200 * count
             )
-            generated_text = response.choices[0].message.content.strip()
-            try:
-                q = json.loads(generated_text)
-            except json.JSONDecodeError:
-                fixed_text = generated_text.replace("'", '"')
-                try:
-                    q = json.loads(fixed_text)
-                except json.JSONDecodeError:
-                    print(f"AI generation failed for {category} (model {model}): Invalid JSON - {generated_text}")
-                    continue
-            if not all(k in q for k in ["question", "options", "answer"]) or not isinstance(q["options"], list) or len(q["options"]) != 4 or q["answer"] not in [1, 2, 3, 4]:
-                print(f"Invalid AI question format for {category} (model {model}): {generated_text}")
-                continue
-            q["ai_generated"] = True
-            q["difficulty"] = difficulty.lower()
-            quizzes.setdefault(category.lower(), []).append(q)
-            save_json(QUIZZES_FILE, quizzes)
-            print(f"Generated AI question for {category} ({difficulty}) using {model}: {q['question']}")
-            return q
         except Exception as e:
+            record_model_result(model, "error", status=getattr(e, "status", None))
             print(f"OpenRouter API error for {category} (model {model}): {e}")
-            continue
+            return None
+        latency = time.monotonic() - start
+        parsed = _parse_ai_json(generated_text)
+        if parsed is None:
+            record_model_result(model, "invalid", latency)
+            print(f"AI generation failed for {category} (model {model}): Invalid JSON - {generated_text}")
+            return None
+        candidates = [q for q in (parsed if isinstance(parsed, list) else [parsed]) if _valid_question(q)]
+        if not candidates:
+            record_model_result(model, "invalid", latency)
+            print(f"Invalid AI question format for {category} (model {model}): {generated_text}")
+            return None
+        record_model_result(model, "valid", latency)
+        items = []
+        batch = NearDuplicateIndex()
+        for q in candidates:
+            if q["question"] in batch or question_id(category, q["question"]) in _bank_pos or is_near_duplicate(category, q["question"]):
+                bank_stats["duplicates"] += 1
+                continue
+            batch.add(q["question"])
+            items.append(q)
+        if not items:
+            print(f"AI questions for {category} (model {model}) were all duplicates of the bank")
+            return None
+        print(f"Generated {len(items)} AI question(s) for {category} ({difficulty}) using {model}: {items[0]['question']}")
+        return items
+    items = await race_models(route_models(QUIZ_MODELS), attempt)
+    if not items:
+        return None
+    stored = []
+    for q in items:
+        q["ai_generated"] = True
+        q["difficulty"] = difficulty.lower()
+        if add_to_bank(q, category):
+            stored.append(q)
+    return stored or None
+
+async def generate_ai_question(category: str, difficulty: str = "medium"):
+    if not OPENROUTER_API_KEY:
+        print("OpenRouter client not initialized. Check OPENROUTER_API_KEY in .env")
+        return None
+    items = await _generate_quiz_items(category, difficulty, 1)
+    if items:
+        return items[0]
     return {"question": f"Failed to generate {category} question.", "options": ["1. N/A", "2. N/A", "3. N/A", "4. N/A"], "answer": 1, "ai_generated": False}
 
+async def generate_ai_questions(category: str, difficulty: str = "medium", count: int = 5):
+    # Batch mode: up to AI_BATCH_MAX questions from a single completion.
+    if not OPENROUTER_API_KEY:
+        return []
+    return await _generate_quiz_items(category, difficulty, max(1, min(count, AI_BATCH_MAX))) or []
+
+def normalize_question(text):
+    return re.sub(r'[^a-z0-9 ]', '', text.lower())
+
+# =============================
+# Question Bank
+# =============================
+# AI questions live in question_bank.json keyed by a hash of their normalized text,
+# so exact duplicates are rejected in O(1) and each one persists as its own log
+# record. Paraphrases are caught by a per-category MinHash/LSH index (near_dup.py).
+# Mod-written questions stay in quizzes.json and are indexed alongside them. Each
+# (category, difficulty) keeps a flat id list for O(1) random sampling; past
+# QUESTION_BANK_CAP the lowest-quality AI question among a small random sample goes.
+QUESTION_BANK_CAP = int(os.getenv("QUESTION_BANK_CAP", "500"))
+bank_stats = {"duplicates": 0, "evicted": 0}
+_bank_index = {}
+_bank_pos = {}
+_curated = {}
+_near_dup = {}
+
+def question_id(category, text):
+    return hashlib.sha1(f"{category.lower()}:{normalize_question(text)}".encode()).hexdigest()[:16]
+
+def is_near_duplicate(category, text):
+    index = _near_dup.get(category.lower())
+    return index is not None and index.query(text) is not None
+
+def bank_get(qid):
+    return question_bank.get(qid) or _curated.get(qid)
+
+def _index_add(key, qid):
+    ids = _bank_index.setdefault(key, [])
+    _bank_pos[qid] = len(ids)
+    ids.append(qid)
+
+def _index_remove(key, qid):
+    ids = _bank_index[key]
+    pos = _bank_pos.pop(qid)
+    last = ids.pop()
+    if last != qid:
+        ids[pos] = last
+        _bank_pos[last] = pos
+
+def question_quality(q):
+    # Questions everyone gets right (or nobody does, usually a wrong answer key) rank lowest.
+    served = q.get("served", 0)
+    if served < 3:
+        return 0.5
+    return 1 - abs(q.get("correct", 0) / served - 0.5) * 2
+
+def _evict(key):
+    ids = _bank_index[key]
+    sample = [qid for qid in random.sample(ids, min(8, len(ids))) if qid in question_bank]
+    if not sample:
+        return
+    victim = min(sample, key=lambda qid: question_quality(question_bank[qid]))
+    _index_remove(key, victim)
+    _near_dup[key[0]].remove(victim)
+    del question_bank[victim]
+    mark_dirty(QUESTION_BANK_FILE, [victim])
+    bank_stats["evicted"] += 1
+
+def add_to_bank(q, category):
+    # Returns the stored question, or None when an equivalent one is already indexed.
+    category = category.lower()
+    qid = question_id(category, q["question"])
+    if qid in _bank_pos:
+        bank_stats["duplicates"] += 1
+        return None
+    near_dup = _near_dup.setdefault(category, NearDuplicateIndex())
+    sig = near_dup.signature(q["question"])
+    if near_dup.query(q["question"], sig) is not None:
+        bank_stats["duplicates"] += 1
+        return None
+    near_dup.add(q["question"], key=qid, sig=sig)
+    key = (category, q.get("difficulty", "medium"))
+    q.update({"id": qid, "category": category, "served": q.get("served", 0), "correct": q.get("correct", 0)})
+    question_bank[qid] = q
+    _index_add(key, qid)
+    mark_dirty(QUESTION_BANK_FILE, [qid])
+    if len(_bank_index[key]) > QUESTION_BANK_CAP:
+        _evict(key)
+    return q
+
+def add_curated(q, category):
+    qid = question_id(category, q["question"])
+    if qid in _bank_pos:
+        return False
+    _curated[qid] = q
+    _index_add((category.lower(), q.get("difficulty", "medium")), qid)
+    _near_dup.setdefault(category.lower(), NearDuplicateIndex()).add(q["question"], key=qid)
+    return True
+
+def sample_question(category, difficulty, seen=()):
+    ids = _bank_index.get((category.lower(), difficulty.lower()))
+    if not ids:
+        return None
+    for qid in random.sample(ids, min(len(ids), 32)):
+        q = bank_get(qid)
+        if q["question"] not in seen:
+            return q
+    return None
+
+def record_question_result(q, correct):
+    qid = q.get("id")
+    if qid in question_bank:
+        q["served"] = q.get("served", 0) + 1
+        q["correct"] = q.get("correct", 0) + int(correct)
+        mark_dirty(QUESTION_BANK_FILE, [qid])
+
+def build_question_bank():
+    for qid, q in question_bank.items():
+        _index_add((q["category"], q.get("difficulty", "medium")), qid)
+        _near_dup.setdefault(q["category"], NearDuplicateIndex()).add(q["question"], key=qid)
+    # AI questions used to be appended to quizzes.json forever; move them into the bank once.
+    moved = 0
+    for category, items in quizzes.items():
+        curated = []
+        for q in items:
+            if q.get("ai_generated"):
+                moved += 1
+                add_to_bank(dict(q), category)
+            else:
+                add_curated(q, category)
+                curated.append(q)
+        items[:] = curated
+    if moved:
+        mark_dirty(QUIZZES_FILE)
+        print(f"Moved {moved} AI questions from {QUIZZES_FILE} into {QUESTION_BANK_FILE}")
+
+build_question_bank()
+
+# =============================
+# Quiz Question Pool
+# =============================
+# Ready-to-serve AI questions per (category, difficulty). Sessions pop from here and
+# only fall back to a live generate_ai_question call on a miss; refill_question_pool
+# keeps recently requested pools at QUESTION_POOL_DEPTH and the rest warm with one.
+# A pool whose refill fails (API down, 429s, only duplicates) is skipped with an
+# exponential backoff, capped at QUESTION_POOL_BACKOFF_MAX_SECONDS, until one succeeds.
+QUIZ_CATEGORIES = ["cybersecurity", "blender", "webdev", "blockchain", "general"]
+QUIZ_DIFFICULTIES = ["easy", "medium", "hard"]
+QUESTION_POOL_DEPTH = int(os.getenv("QUESTION_POOL_DEPTH", "5"))
+QUESTION_POOL_WORKERS = int(os.getenv("QUESTION_POOL_WORKERS", "2"))
+QUESTION_POOL_IDLE_SECONDS = int(os.getenv("QUESTION_POOL_IDLE_SECONDS", "3600"))
+QUESTION_POOL_BACKOFF_MAX_SECONDS = int(os.getenv("QUESTION_POOL_BACKOFF_MAX_SECONDS", "1800"))
+question_pool = {(c, d): deque() for c in QUIZ_CATEGORIES for d in QUIZ_DIFFICULTIES}
+pool_stats = {"hits": 0, "misses": 0, "refilled": 0, "refill_failures": 0}
+_pool_last_demand = {}
+_pool_locks = {}
+_pool_refill_times = deque()
+_pool_backoff = {}
+_pool_prefetches = {}
+
+async def take_question(category, difficulty, seen=()):
+    key = (category.lower(), difficulty.lower())
+    _pool_last_demand[key] = time.monotonic()
+    pool = question_pool.setdefault(key, deque())
+    for q in pool:
+        if q["question"] not in seen:
+            pool.remove(q)
+            pool_stats["hits"] += 1
+            return q
+    prefetch = _pool_prefetches.get(key)
+    lock = _pool_locks.get(key)
+    if prefetch or lock and lock.locked():
+        # A batch for this pool is already in flight; wait for it instead of paying for another call.
+        if prefetch:
+            await asyncio.wait([prefetch])
+        else:
+            async with lock:
+                pass
+        for q in pool:
+            if q["question"] not in seen:
+                pool.remove(q)
+                pool_stats["hits"] += 1
+                return q
+    pool_stats["misses"] += 1
+    question = await generate_ai_question(category, difficulty)
+    if not question or question["question"].startswith("Failed to generate"):
+        # No LLM, or everything it produced was already in the bank: serve an unseen bank question.
+        question = sample_question(category, difficulty, seen) or question
+    return question
+
+async def next_question(category, difficulty, seen):
+    # A question for a session that isn't in seen (a NearDuplicateIndex): up to five
+    # pool/AI attempts, then an unseen bank question. The question is added to seen.
+    for _ in range(5):
+        question = await take_question(category, difficulty, seen)
+        if question and not question["question"].startswith("Failed to generate") and question["question"] not in seen:
+            break
+    else:
+        question = sample_question(category, difficulty, seen)
+    if question:
+        seen.add(question["question"])
+    return question
+
+def prefetch_questions(category, difficulty, count):
+    # Tops the pool up to count with one batched completion in the background, so a
+    # session starts on what is already pooled and take_question picks up the batch
+    # when it lands instead of making a call per question.
+    key = (category.lower(), difficulty.lower())
+    if not OPENROUTER_API_KEY or key in _pool_prefetches or len(question_pool.setdefault(key, deque())) >= count:
+        return
+    task = asyncio.create_task(fill_pool(key, count))
+    _pool_prefetches[key] = task
+    task.add_done_callback(lambda _: _pool_prefetches.pop(key, None))
+
+def pool_target(key):
+    last = _pool_last_demand.get(key)
+    if last is not None and time.monotonic() - last < QUESTION_POOL_IDLE_SECONDS:
+        return QUESTION_POOL_DEPTH
+    return min(1, QUESTION_POOL_DEPTH)
+
+def pool_refill_rate():
+    # Questions added to the pool over the last minute.
+    cutoff = time.monotonic() - 60
+    while _pool_refill_times and _pool_refill_times[0] < cutoff:
+        _pool_refill_times.popleft()
+    return len(_pool_refill_times)
+
+async def fill_pool(key, target):
+    # Tops the pool up to target with one batched completion (at most AI_BATCH_MAX questions).
+    if not OPENROUTER_API_KEY:
+        return
+    lock = _pool_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        shortfall = target - len(question_pool[key])
+        if shortfall <= 0:
+            return
+        try:
+            items = await generate_ai_questions(*key, count=shortfall)
+        except Exception as e:
+            print(f"Question pool refill for {key} failed: {e}")
+            items = None
+        if not items:
+            pool_stats["refill_failures"] += 1
+            failures = _pool_backoff.get(key, (0, 0))[0] + 1
+            _pool_backoff[key] = (failures, time.monotonic() + min(QUESTION_POOL_BACKOFF_MAX_SECONDS, 10 * 2 ** (failures - 1)))
+            return
+        _pool_backoff.pop(key, None)
+        question_pool[key].extend(items)
+        pool_stats["refilled"] += len(items)
+        _pool_refill_times.extend([time.monotonic()] * len(items))
+
+@tasks.loop(seconds=5)
+async def refill_question_pool():
+    if not OPENROUTER_API_KEY:
+        return
+    now = time.monotonic()
+    short = [key for key, pool in question_pool.items() if len(pool) < pool_target(key) and _pool_backoff.get(key, (0, 0))[1] <= now]
+    if not short:
+        return
+    # Most recently requested pools first, then the emptiest.
+    short.sort(key=lambda k: (-_pool_last_demand.get(k, 0), len(question_pool[k])))
+    await asyncio.gather(*(fill_pool(key, pool_target(key)) for key in short[:QUESTION_POOL_WORKERS]), return_exceptions=True)
+
+# Quizzes and duels are admitted through game_session. A player can be in one game
+# at a time, and at most MAX_ACTIVE_SESSIONS run at once (by default twice the
+# OpenRouter concurrency, since every session pulls questions from the LLM). Beyond
+# that, sessions wait in a FIFO queue that holds at most one entry per player, so
+# nobody can crowd others out, up to SESSION_QUEUE_LIMIT entries.
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", str(OPENROUTER_MAX_CONCURRENCY * 2)))
+SESSION_QUEUE_LIMIT = int(os.getenv("SESSION_QUEUE_LIMIT", "50"))
+SESSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("SESSION_QUEUE_TIMEOUT_SECONDS", "600"))
+# Interaction followups stop working 15 minutes after the command, and a /quiz runs
+# entirely on followups, so the queue wait is capped by what the game itself may take.
+INTERACTION_TOKEN_SECONDS = 15 * 60
+SESSION_SECONDS_PER_QUESTION = 25
+SESSION_MARGIN_SECONDS = 60
+active_sessions = {}
+_sessions_by_user = {}
+_sessions_by_channel = {}
+_session_queue = deque()
+_session_waits = deque(maxlen=200)
+_next_session_id = 0
+session_stats = {"started": 0, "queued": 0, "rejected": 0}
+
+class SessionRejected(Exception):
+    pass
+
+def _admit_next_sessions():
+    while _session_queue and len(active_sessions) < MAX_ACTIVE_SESSIONS:
+        future = _session_queue.popleft()[0]
+        if not future.done():
+            future.set_result(None)
+            # Reserve the slot until the woken session registers itself.
+            active_sessions[("reserved", id(future))] = None
+
+def session_wait_budget(interaction, questions):
+    # Longest the session may queue and still send its last followup in time.
+    used = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    game = questions * SESSION_SECONDS_PER_QUESTION + SESSION_MARGIN_SECONDS
+    return min(SESSION_QUEUE_TIMEOUT_SECONDS, INTERACTION_TOKEN_SECONDS - used - game)
+
+def session_wait(pct):
+    waits = sorted(_session_waits)
+    if not waits:
+        return None
+    return waits[min(len(waits) - 1, int(len(waits) * pct))]
+
+@asynccontextmanager
+async def game_session(kind, user_ids, channel_id, notify=None, max_wait=SESSION_QUEUE_TIMEOUT_SECONDS):
+    # notify(position) is awaited if the session has to queue; it waits at most max_wait seconds.
+    global _next_session_id
+    busy = [uid for uid in user_ids if uid in _sessions_by_user or any(uid in queued[1] for queued in _session_queue)]
+    if busy:
+        session_stats["rejected"] += 1
+        raise SessionRejected(f"<@{busy[0]}> is already in a quiz or duel. Finish it first.")
+    queued_at = time.monotonic()
+    reserved = None
+    if len(active_sessions) >= MAX_ACTIVE_SESSIONS or _session_queue:
+        if len(_session_queue) >= SESSION_QUEUE_LIMIT:
+            session_stats["rejected"] += 1
+            raise SessionRejected("The bot is running too many games right now. Try again in a few minutes.")
+        if max_wait <= 0:
+            session_stats["rejected"] += 1
+            raise SessionRejected("All game slots are busy and a game this long couldn't finish in time if it queued. Try fewer questions or again in a few minutes.")
+        future = asyncio.get_running_loop().create_future()
+        _session_queue.append((future, set(user_ids)))
+        session_stats["queued"] += 1
+        try:
+            if notify:
+                await notify(len(_session_queue))
+            await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except BaseException as e:
+            if future.done():
+                active_sessions.pop(("reserved", id(future)), None)
+                _admit_next_sessions()
+            else:
+                future.cancel()
+                _session_queue.remove(next(q for q in _session_queue if q[0] is future))
+            if isinstance(e, asyncio.TimeoutError):
+                session_stats["rejected"] += 1
+                raise SessionRejected("No game slot freed up in time. Try again in a few minutes.") from None
+            raise
+        reserved = ("reserved", id(future))
+    _session_waits.append(time.monotonic() - queued_at)
+    _next_session_id += 1
+    session_id = _next_session_id
+    active_sessions.pop(reserved, None)
+    active_sessions[session_id] = {"kind": kind, "users": list(user_ids), "channel_id": channel_id, "started": time.monotonic()}
+    for uid in user_ids:
+        _sessions_by_user[uid] = session_id
+    _sessions_by_channel.setdefault(channel_id, set()).add(session_id)
+    session_stats["started"] += 1
+    try:
+        yield session_id
+    finally:
+        for uid in active_sessions.pop(session_id)["users"]:
+            _sessions_by_user.pop(uid, None)
+        _sessions_by_channel[channel_id].discard(session_id)
+        if not _sessions_by_channel[channel_id]:
+            del _sessions_by_channel[channel_id]
+        _admit_next_sessions()
+
+def join_session(session_id, user_ids):
+    # Adds players to a running session; returns those already in (or queued for) another game.
+    busy = [uid for uid in user_ids if _sessions_by_user.get(uid, session_id) != session_id or any(uid in queued[1] for queued in _session_queue)]
+    session = active_sessions[session_id]
+    for uid in user_ids:
+        if uid not in busy and uid not in _sessions_by_user:
+            _sessions_by_user[uid] = session_id
+            session["users"].append(uid)
+    return busy
+
+ANSWER_MODES = ["buttons", "chat"]
+
+class AnswerView(discord.ui.View):
+    # Buttons 1-4 under a question. Collects one answer per player; the question
+    # message is then edited once to show the results and disable the buttons.
+    def __init__(self, player_ids, timeout=20):
+        super().__init__(timeout=timeout)
+        self.player_ids = set(player_ids)
+        self.answers = {}
+        self.message = None
+        self._all_answered = asyncio.Event()
+        for n in range(1, 5):
+            button = discord.ui.Button(label=str(n), style=discord.ButtonStyle.primary)
+            button.callback = self._answer_callback(n)
+            self.add_item(button)
+
+    def _answer_callback(self, n):
+        async def callback(interaction: discord.Interaction):
+            if interaction.user.id not in self.player_ids:
+                await interaction.response.send_message("❌ You're not playing this question.", ephemeral=True)
+                return
+            if interaction.user.id in self.answers:
+                await interaction.response.send_message("❌ You already answered.", ephemeral=True)
+                return
+            self.answers[interaction.user.id] = n
+            await interaction.response.defer()
+            if len(self.answers) == len(self.player_ids):
+                self._all_answered.set()
+        return callback
+
+    async def collect(self):
+        try:
+            await asyncio.wait_for(self._all_answered.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.stop()
+        return self.answers
+
+    async def show_results(self, lines):
+        for item in self.children:
+            item.disabled = True
+        content = self.message.content + "\n\n" + "\n".join(lines)
+        if isinstance(self.message, discord.WebhookMessage):
+            # Interaction followups are edited through the webhook, outside the channel's send budget.
+            await self.message.edit(content=content, view=self)
+        else:
+            await queue_channel_send(self.message.channel, content, view=self, edit=self.message)
+
 @tree.command(name="quiz", description="Answer one or more AI-generated quiz questions by category (in #game channel only)")
-@app_commands.describe(category="Topic: cybersecurity, blender, webdev, blockchain, general", questions="Number of questions (max 20)", difficulty="Difficulty: easy, medium, hard")
-async def quiz(interaction: discord.Interaction, category: str = "general", questions: int = 1, difficulty: str = "medium"):
+@app_commands.describe(category="Topic: cybersecurity, blender, webdev, blockchain, general", questions="Number of questions (max 20)", difficulty="Difficulty: easy, medium, hard", answer_mode="Answer with buttons or chat (default buttons)")
+async def quiz(interaction: discord.Interaction, category: str = "general", questions: int = 1, difficulty: str = "medium", answer_mode: str = "buttons"):
     print(f"Quiz command invoked by {interaction.user.id} in channel {interaction.channel.id}")
     if interaction.channel.id != GAME_CHANNEL_ID:
         await interaction.response.send_message(f"❌ Use this in <#{GAME_CHANNEL_ID}> only.", ephemeral=True)
@@ -629,7 +2232,17 @@ async def quiz(interaction: discord.Interaction, category: str = "general", ques
         await interaction.followup.send(f"❌ Invalid difficulty. Try: {', '.join(valid_difficulties)}.", ephemeral=True)
         print(f"Quiz failed: Invalid difficulty {difficulty}")
         return
+    if answer_mode.lower() not in ANSWER_MODES:
+        await interaction.followup.send(f"❌ Invalid answer mode. Try: {', '.join(ANSWER_MODES)}.", ephemeral=True)
+        return
     questions = max(1, min(questions, 20))
+    try:
+        async with game_session("quiz", [interaction.user.id], interaction.channel.id, notify=lambda position: interaction.followup.send(f"⏳ All game slots are busy. You're #{position} in line; your quiz starts automatically.", ephemeral=True), max_wait=session_wait_budget(interaction, questions)):
+            await run_quiz_session(interaction, category, questions, difficulty, answer_mode.lower())
+    except SessionRejected as e:
+        await interaction.followup.send(f"❌ {e}", ephemeral=True)
+
+async def run_quiz_session(interaction, category, questions, difficulty, answer_mode):
     user_id = str(interaction.user.id)
     progress_data.setdefault(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
     today = datetime.now().strftime("%Y-%m-%d")
@@ -638,37 +2251,38 @@ async def quiz(interaction: discord.Interaction, category: str = "general", ques
         progress_data[user_id]["last_activity"] = today
     total_points = 0
     correct = 0
-    seen_questions = set()
-    import re
-    def normalize_question(text):
-        return re.sub(r'[^a-z0-9 ]', '', text.lower())
+    seen_questions = NearDuplicateIndex()
+    prefetch_questions(category, difficulty, questions)
     for q_num in range(1, questions + 1):
-        tries = 0
-        question = None
-        norm = None
-        while tries < 5:
-            question = await generate_ai_question(category, difficulty)
-            if not question or question.get("question", "").startswith("Failed to generate"):
-                tries += 1
-                continue
-            norm = normalize_question(question["question"])
-            if norm in seen_questions:
-                tries += 1
-                continue
-            seen_questions.add(norm)
-            break
-        if not question or question.get("question", "").startswith("Failed to generate") or norm in seen_questions:
+        question = await next_question(category, difficulty, seen_questions)
+        if not question:
             await interaction.followup.send(f"❌ No valid unique AI quiz question available for {category} (Q{q_num}). Try again later or with a different category/difficulty.", ephemeral=True)
             print(f"No valid unique AI quiz question for {category} (Q{q_num})")
             continue
-        await interaction.followup.send(f"🧩 Quiz {q_num}/{questions} ({category.title()}, {difficulty.title()})!\n**{question['question']}**\n" + "\n".join(question["options"]))
+        text = f"🧩 Quiz {q_num}/{questions} ({category.title()}, {difficulty.title()})!\n**{question['question']}**\n" + "\n".join(question["options"])
+        view = None
+        if answer_mode == "buttons":
+            view = AnswerView([interaction.user.id])
+            view.message = await interaction.followup.send(text, view=view, wait=True)
+        else:
+            await interaction.followup.send(text)
         print(f"Quiz question {q_num} posted for {user_id}: {question['question']}")
-        def check(m):
-            return m.author == interaction.user and m.channel == interaction.channel and m.content.isdigit() and 1 <= int(m.content) <= 4
-        try:
-            msg = await bot.wait_for("message", check=check, timeout=20)
+        if view:
+            answer = (await view.collect()).get(interaction.user.id)
+        else:
+            try:
+                answer = int((await wait_for_message(interaction.channel.id, [interaction.user.id], _is_answer, timeout=20)).content)
+            except asyncio.TimeoutError:
+                answer = None
+        results = []
+        if answer is None:
+            record_question_result(question, False)
+            results.append(f"⌛ Time’s up, {interaction.user.mention}! Correct: {question['options'][question['answer']-1]}.")
+            print(f"Quiz timed out for user {user_id} in {category} (Q{q_num})")
+        else:
             points = 0
-            if int(msg.content) == question["answer"]:
+            record_question_result(question, answer == question["answer"])
+            if answer == question["answer"]:
                 points = 2 + (5 if question.get("ai_generated", False) else 0)
                 progress_data[user_id]["points"] += points
                 progress_data[user_id]["category_points"].setdefault(category, 0)
@@ -676,28 +2290,31 @@ async def quiz(interaction: discord.Interaction, category: str = "general", ques
                 if progress_data[user_id]["streak"] > 2:
                     points = int(points * 1.5)
                     progress_data[user_id]["points"] = int(progress_data[user_id]["points"] * 1.5)
-                await interaction.followup.send(f"✅ Correct, {interaction.user.mention}! 🎉 (+{points} points)")
+                results.append(f"✅ Correct, {interaction.user.mention}! 🎉 (+{points} points)")
                 correct += 1
                 total_points += points
             else:
-                await interaction.followup.send(f"❌ Wrong, {interaction.user.mention}. Correct: {question['options'][question['answer']-1]}.")
+                results.append(f"❌ Wrong, {interaction.user.mention}. Correct: {question['options'][question['answer']-1]}.")
             if challenges["current"] and challenges["date"] == today and challenges["current"]["type"] == "quiz_master":
                 challenges["user_progress"].setdefault(user_id, {"quiz_score": 0, "num_questions": 0})
                 challenges["user_progress"][user_id]["num_questions"] += 1
-                challenges["user_progress"][user_id]["quiz_score"] += 1 if int(msg.content) == question["answer"] else 0
+                challenges["user_progress"][user_id]["quiz_score"] += 1 if answer == question["answer"] else 0
                 total_qs = challenges["user_progress"][user_id]["num_questions"]
                 score = challenges["user_progress"][user_id]["quiz_score"] / total_qs if total_qs > 0 else 0
                 if score >= challenges["current"]["requirements"]["quiz_score"] and total_qs >= challenges["current"]["requirements"]["num_questions"]:
                     progress_data[user_id]["points"] += challenges["current"]["points"]
                     progress_data[user_id]["category_points"][category] += challenges["current"]["points"]
-                    await interaction.followup.send(f"🎉 Completed daily challenge! +{challenges['current']['points']} points")
-            save_json(PROGRESS_FILE, progress_data)
-            save_json(CHALLENGES_FILE, challenges)
+                    results.append(f"🎉 Completed daily challenge! +{challenges['current']['points']} points")
+            mark_dirty(PROGRESS_FILE, [user_id])
+            update_rankings(user_id)
+            mark_dirty(CHALLENGES_FILE, [("user_progress", user_id)])
             await check_roles(interaction.user)
-            print(f"Quiz completed for user {user_id} in {category}: {'Correct' if int(msg.content) == question['answer'] else 'Wrong'}, +{points} points")
-        except asyncio.TimeoutError:
-            await interaction.followup.send(f"⌛ Time’s up, {interaction.user.mention}! Correct: {question['options'][question['answer']-1]}.")
-            print(f"Quiz timed out for user {user_id} in {category} (Q{q_num})")
+            print(f"Quiz completed for user {user_id} in {category}: {'Correct' if answer == question['answer'] else 'Wrong'}, +{points} points")
+        if view:
+            await view.show_results(results)
+        else:
+            for line in results:
+                await interaction.followup.send(line)
     await interaction.followup.send(f"🏁 Quiz session complete! You answered {correct}/{questions} correctly and earned {total_points} points.", ephemeral=True)
 
 # =============================
@@ -706,23 +2323,20 @@ async def quiz(interaction: discord.Interaction, category: str = "general", ques
 async def create_challenge_thread(channel, challenger, friend, category, questions, difficulty):
     thread_name = f"Quiz Duel: {challenger.display_name} vs {friend.display_name}"
     thread = await channel.create_thread(name=thread_name, type=discord.ChannelType.private_thread, invitable=False)
-    await thread.add_user(challenger)
-    await thread.add_user(friend)
-    await thread.send(f"👾 {challenger.mention} has challenged {friend.mention} to a {questions}-question quiz duel in {category.title()} (difficulty: {difficulty.title()})! {friend.mention}, type 'accept' to play or 'decline' to ignore.")
+    await asyncio.gather(thread.add_user(challenger), thread.add_user(friend))
+    await queue_channel_send(thread, f"👾 {challenger.mention} has challenged {friend.mention} to a {questions}-question quiz duel in {category.title()} (difficulty: {difficulty.title()})! {friend.mention}, type 'accept' to play or 'decline' to ignore.")
     return thread
 
 async def await_challenge_acceptance(bot, thread, friend):
-    def check(m):
-        return m.channel == thread and m.author == friend and m.content.lower() in ["accept", "decline"]
     try:
-        reply = await bot.wait_for("message", check=check, timeout=60)
+        reply = await wait_for_message(thread.id, [friend.id], _is_accept_reply, timeout=60)
         if reply.content.lower() == "decline":
-            await thread.send(f"❌ {friend.mention} declined the challenge.")
+            await queue_channel_send(thread, f"❌ {friend.mention} declined the challenge.")
             return False
-        await thread.send(f"✅ Challenge accepted! The quiz will begin shortly.")
+        await queue_channel_send(thread, f"✅ Challenge accepted! The quiz will begin shortly.")
         return True
     except asyncio.TimeoutError:
-        await thread.send(f"⌛ {friend.mention} did not respond in time. Challenge cancelled.")
+        await queue_channel_send(thread, f"⌛ {friend.mention} did not respond in time. Challenge cancelled.")
         return False
 
 async def run_quiz_duel_session(bot, thread, challenger, friend, category, questions, difficulty):
@@ -739,37 +2353,23 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
         progress_data[friend_id]["last_activity"] = today
     challenger_score = 0
     friend_score = 0
-    seen_questions = set()
-    import re
-    def normalize_question(text):
-        return re.sub(r'[^a-z0-9 ]', '', text.lower())
+    seen_questions = NearDuplicateIndex()
+    prefetch_questions(category, difficulty, questions)
     for q_num in range(1, questions + 1):
-        tries = 0
-        while tries < 5:
-            question = await generate_ai_question(category, difficulty)
-            if not question or question["question"].startswith("Failed to generate"):
-                tries += 1
-                continue
-            norm = normalize_question(question["question"])
-            if norm in seen_questions:
-                tries += 1
-                continue
-            seen_questions.add(norm)
-            break
-        if not question or question["question"].startswith("Failed to generate") or norm in seen_questions:
-            await thread.send(f"❌ No valid unique question for Q{q_num}. Skipping to next or ending duel.")
+        question = await next_question(category, difficulty, seen_questions)
+        if not question:
+            await queue_channel_send(thread, f"❌ No valid unique question for Q{q_num}. Skipping to next or ending duel.")
             print(f"No valid unique question for duel Q{q_num} ({category}, {difficulty})")
             continue
-        await thread.send(f"🧩 Duel Question {q_num}/{questions} ({category.title()}, {difficulty.title()})\n**{question['question']}**\n" + "\n".join(question["options"]) + f"\n{challenger.mention} and {friend.mention}, reply with 1-4 within 20 seconds!")
+        await queue_channel_send(thread, f"🧩 Duel Question {q_num}/{questions} ({category.title()}, {difficulty.title()})\n**{question['question']}**\n" + "\n".join(question["options"]) + f"\n{challenger.mention} and {friend.mention}, reply with 1-4 within 20 seconds!")
         print(f"Duel question {q_num} posted: {question['question']}")
         challenger_answer = None
         friend_answer = None
-        def check(m):
-            return m.channel == thread and m.author in [challenger, friend] and m.content.isdigit() and 1 <= int(m.content) <= 4
         try:
             tasks = []
             while len(tasks) < 2:
-                msg = await bot.wait_for("message", check=check, timeout=20 - (len(tasks) * 0.1))
+                waiting = [p.id for p, answer in [(challenger, challenger_answer), (friend, friend_answer)] if answer is None]
+                msg = await wait_for_message(thread.id, waiting, _is_answer, timeout=20 - (len(tasks) * 0.1))
                 if msg.author == challenger and challenger_answer is None:
                     challenger_answer = int(msg.content)
                     tasks.append("challenger")
@@ -778,6 +2378,8 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
                     tasks.append("friend")
         except asyncio.TimeoutError:
             pass
+        record_question_result(question, challenger_answer == question["answer"])
+        record_question_result(question, friend_answer == question["answer"])
         points = 2 + (5 if question.get("ai_generated", False) else 0)
         if challenger_answer == question["answer"]:
             challenger_score += 1
@@ -786,9 +2388,9 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
             progress_data[challenger_id]["category_points"][category] += points
             if progress_data[challenger_id]["streak"] > 2:
                 progress_data[challenger_id]["points"] = int(progress_data[challenger_id]["points"] * 1.5)
-            await thread.send(f"✅ {challenger.mention} got it right! (+{points} points)")
+            await queue_channel_send(thread, f"✅ {challenger.mention} got it right! (+{points} points)")
         else:
-            await thread.send(f"❌ {challenger.mention} got it wrong." + (f" Answer: {challenger_answer}" if challenger_answer else ""))
+            await queue_channel_send(thread, f"❌ {challenger.mention} got it wrong." + (f" Answer: {challenger_answer}" if challenger_answer else ""))
         if friend_answer == question["answer"]:
             friend_score += 1
             progress_data[friend_id]["points"] += points
@@ -796,10 +2398,10 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
             progress_data[friend_id]["category_points"][category] += points
             if progress_data[friend_id]["streak"] > 2:
                 progress_data[friend_id]["points"] = int(progress_data[friend_id]["points"] * 1.5)
-            await thread.send(f"✅ {friend.mention} got it right! (+{points} points)")
+            await queue_channel_send(thread, f"✅ {friend.mention} got it right! (+{points} points)")
         else:
-            await thread.send(f"❌ {friend.mention} got it wrong." + (f" Answer: {friend_answer}" if friend_answer else ""))
-        await thread.send(f"Correct: {question['options'][question['answer']-1]}")
+            await queue_channel_send(thread, f"❌ {friend.mention} got it wrong." + (f" Answer: {friend_answer}" if friend_answer else ""))
+        await queue_channel_send(thread, f"Correct: {question['options'][question['answer']-1]}")
         # Daily challenge check
         for user_id, user in [(challenger_id, challenger), (friend_id, friend)]:
             if challenges["current"] and challenges["date"] == today and challenges["current"]["type"] == "quiz_master":
@@ -811,9 +2413,10 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
                 if score >= challenges["current"]["requirements"]["quiz_score"] and total_qs >= challenges["current"]["requirements"]["num_questions"]:
                     progress_data[user_id]["points"] += challenges["current"]["points"]
                     progress_data[user_id]["category_points"][category] += challenges["current"]["points"]
-                    await thread.send(f"🎉 {user.mention} completed daily challenge! +{challenges['current']['points']} points")
-        save_json(PROGRESS_FILE, progress_data)
-        save_json(CHALLENGES_FILE, challenges)
+                    await queue_channel_send(thread, f"🎉 {user.mention} completed daily challenge! +{challenges['current']['points']} points")
+        mark_dirty(PROGRESS_FILE, [challenger_id, friend_id])
+        update_rankings(challenger_id, friend_id)
+        mark_dirty(CHALLENGES_FILE, [("user_progress", challenger_id), ("user_progress", friend_id)])
         await check_roles(challenger)
         await check_roles(friend)
         print(f"Duel Q{q_num}: {challenger.name} ({'Correct' if challenger_answer == question['answer'] else 'Wrong'}), {friend.name} ({'Correct' if friend_answer == question['answer'] else 'Wrong'})")
@@ -832,9 +2435,10 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
         progress_data[winner_id]["points"] += 10
         progress_data[winner_id]["category_points"].setdefault(category, 0)
         progress_data[winner_id]["category_points"][category] += 10
-        save_json(PROGRESS_FILE, progress_data)
+        mark_dirty(PROGRESS_FILE, [winner_id])
+        update_rankings(winner_id)
         await check_roles(winner)
-    await thread.send(f"🏁 Duel complete! {challenger.mention}: {challenger_score}, {friend.mention}: {friend_score}. {result}")
+    await queue_channel_send(thread, f"🏁 Duel complete! {challenger.mention}: {challenger_score}, {friend.mention}: {friend_score}. {result}")
     print(f"Duel complete: {challenger.name} ({challenger_score}) vs {friend.name} ({friend_score})")
     try:
         await thread.edit(archived=True, locked=True)
@@ -846,14 +2450,16 @@ async def run_quiz_duel_session(bot, thread, challenger, friend, category, quest
     friends="Tag up to 5 users to challenge (separate with spaces)",
     category="Quiz category: cybersecurity, blender, webdev, blockchain, general",
     questions="Number of questions (max 10)",
-    difficulty="Difficulty: easy, medium, hard"
+    difficulty="Difficulty: easy, medium, hard",
+    answer_mode="Answer with buttons or chat (default buttons)"
 )
 async def challenge_friend(
     interaction: discord.Interaction,
     friends: str,
     category: str = "general",
     questions: int = 5,
-    difficulty: str = "medium"
+    difficulty: str = "medium",
+    answer_mode: str = "buttons"
 ):
     valid_categories = ["cybersecurity", "blender", "webdev", "blockchain", "general"]
     valid_difficulties = ["easy", "medium", "hard"]
@@ -864,6 +2470,9 @@ async def challenge_friend(
     if difficulty.lower() not in valid_difficulties:
         await interaction.followup.send(f"❌ Invalid difficulty. Choose from: {', '.join(valid_difficulties)}.", ephemeral=True)
         return
+    if answer_mode.lower() not in ANSWER_MODES:
+        await interaction.followup.send(f"❌ Invalid answer mode. Choose from: {', '.join(ANSWER_MODES)}.", ephemeral=True)
+        return
     questions = max(1, min(questions, 10))
     # Parse mentions (expecting <@id> format)
     friend_ids = [int(fid.strip('<@!>')) for fid in friends.split() if fid.strip('<@!>').isdigit()]
@@ -873,7 +2482,6 @@ async def challenge_friend(
     if interaction.user.id in friend_ids:
         await interaction.followup.send("❌ You cannot challenge yourself!", ephemeral=True)
         return
-    channel = interaction.channel
     # Fetch member objects
     guild = interaction.guild
     friend_members = [guild.get_member(fid) for fid in friend_ids if guild.get_member(fid) and not guild.get_member(fid).bot]
@@ -884,35 +2492,48 @@ async def challenge_friend(
         await interaction.followup.send(f"❌ Use this in <#{GAME_CHANNEL_ID}> only.", ephemeral=True)
         print(f"Challenge failed: Wrong channel {interaction.channel.id}")
         return
+    try:
+        # Only the challenger is held during acceptance; friends join once they accept.
+        async with game_session("group_duel", [interaction.user.id], interaction.channel.id, notify=lambda position: interaction.followup.send(f"⏳ All game slots are busy. You're #{position} in line; the challenge starts automatically.", ephemeral=True), max_wait=session_wait_budget(interaction, 0)) as session_id:
+            await host_group_challenge(interaction, session_id, friend_members, category, questions, difficulty, answer_mode.lower())
+    except SessionRejected as e:
+        await interaction.followup.send(f"❌ {e}", ephemeral=True)
+
+async def host_group_challenge(interaction, session_id, friend_members, category, questions, difficulty, answer_mode):
+    channel = interaction.channel
     # Create thread and add all users
     thread_name = f"Quiz Duel: {interaction.user.display_name} vs {'/'.join([m.display_name for m in friend_members])}"
     thread = await channel.create_thread(name=thread_name, type=discord.ChannelType.private_thread, invitable=False)
-    await thread.add_user(interaction.user)
-    for m in friend_members:
-        await thread.add_user(m)
-    await thread.send(f"👾 {interaction.user.mention} has challenged {' '.join([m.mention for m in friend_members])} to a {questions}-question quiz duel in {category.title()} (difficulty: {difficulty.title()})! Each, type 'accept' to play or 'decline' to ignore.")
-    # Wait for all to accept
-    accepted = []
-    for m in friend_members:
-        def check(msg, member=m):
-            return msg.channel == thread and msg.author == member and msg.content.lower() in ["accept", "decline"]
+    await asyncio.gather(*(thread.add_user(m) for m in [interaction.user] + friend_members))
+    await queue_channel_send(thread, f"👾 {interaction.user.mention} has challenged {' '.join([m.mention for m in friend_members])} to a {questions}-question quiz duel in {category.title()} (difficulty: {difficulty.title()})! Each, type 'accept' to play or 'decline' to ignore.")
+    # Everyone answers against one shared 60 second deadline; the duel starts as soon as all have replied.
+    deadline = time.monotonic() + 60
+    async def await_reply(member):
         try:
-            reply = await bot.wait_for("message", check=check, timeout=60)
-            if reply.content.lower() == "accept":
-                accepted.append(m)
-            else:
-                await thread.send(f"❌ {m.mention} declined the challenge.")
+            reply = await wait_for_message(thread.id, [member.id], _is_accept_reply, timeout=max(0, deadline - time.monotonic()))
         except asyncio.TimeoutError:
-            await thread.send(f"⌛ {m.mention} did not respond in time. Challenge cancelled for them.")
+            await queue_channel_send(thread, f"⌛ {member.mention} did not respond in time. Challenge cancelled for them.")
+            return False
+        if reply.content.lower() == "accept":
+            return True
+        await queue_channel_send(thread, f"❌ {member.mention} declined the challenge.")
+        return False
+    replies = await asyncio.gather(*(await_reply(m) for m in friend_members))
+    accepted = [m for m, ok in zip(friend_members, replies) if ok]
+    busy = join_session(session_id, [m.id for m in accepted])
+    for m in accepted:
+        if m.id in busy:
+            await queue_channel_send(thread, f"❌ {m.mention} started another game in the meantime and is left out of this duel.")
+    accepted = [m for m in accepted if m.id not in busy]
     if not accepted:
-        await thread.send("❌ No one accepted the challenge. Duel cancelled.")
+        await queue_channel_send(thread, "❌ No one accepted the challenge. Duel cancelled.")
         await thread.edit(archived=True, locked=True)
         return
-    await thread.send(f"✅ Challenge accepted by: {' '.join([m.mention for m in accepted])}! The quiz will begin shortly.")
-    await run_group_quiz_duel_session(bot, thread, [interaction.user] + accepted, category, questions, difficulty)
+    await queue_channel_send(thread, f"✅ Challenge accepted by: {' '.join([m.mention for m in accepted])}! The quiz will begin shortly.")
+    await run_group_quiz_duel_session(bot, thread, [interaction.user] + accepted, category, questions, difficulty, answer_mode)
 
 # Group duel session logic
-async def run_group_quiz_duel_session(bot, thread, players, category, questions, difficulty):
+async def run_group_quiz_duel_session(bot, thread, players, category, questions, difficulty, answer_mode="buttons"):
     ids = [str(p.id) for p in players]
     for pid in ids:
         progress_data.setdefault(pid, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
@@ -922,48 +2543,33 @@ async def run_group_quiz_duel_session(bot, thread, players, category, questions,
             progress_data[pid]["streak"] += 1
             progress_data[pid]["last_activity"] = today
     scores = {pid: 0 for pid in ids}
-    seen_questions = set()
-    import re
-    def normalize_question(text):
-        return re.sub(r'[^a-z0-9 ]', '', text.lower())
+    seen_questions = NearDuplicateIndex()
+    prefetch_questions(category, difficulty, questions)
     for q_num in range(1, questions + 1):
-        tries = 0
-        question = None
-        norm = None
-        while tries < 5:
-            question = await generate_ai_question(category, difficulty)
-            if not question or question["question"].startswith("Failed to generate"):
-                tries += 1
-                continue
-            norm = normalize_question(question["question"])
-            if norm in seen_questions:
-                tries += 1
-                continue
-            seen_questions.add(norm)
-            break
-        # Fallback to stored questions if all AI fail
-        if not question or question["question"].startswith("Failed to generate") or norm in seen_questions:
-            available = [q for q in quizzes.get(category, []) if q.get("difficulty", "medium") == difficulty.lower() and normalize_question(q["question"]) not in seen_questions]
-            if available:
-                question = random.choice(available)
-                norm = normalize_question(question["question"])
-                seen_questions.add(norm)
-            else:
-                await thread.send(f"❌ No valid unique quiz question for Q{q_num}. Skipping.")
-                continue
-        await thread.send(f"🧩 Group Duel Q{q_num}/{questions} ({category.title()}, {difficulty.title()})\n**{question['question']}**\n" + "\n".join(question["options"]) + f"\nPlayers: {' '.join([p.mention for p in players])}, reply with 1-4 within 20 seconds!")
-        answers = {}
-        def check(m):
-            return m.channel == thread and m.author in players and m.content.isdigit() and 1 <= int(m.content) <= 4 and m.author.id not in answers
-        try:
-            while len(answers) < len(players):
-                msg = await bot.wait_for("message", check=check, timeout=20)
-                answers[msg.author.id] = int(msg.content)
-        except asyncio.TimeoutError:
-            pass
+        question = await next_question(category, difficulty, seen_questions)
+        if not question:
+            await queue_channel_send(thread, f"❌ No valid unique quiz question for Q{q_num}. Skipping.")
+            continue
+        text = f"🧩 Group Duel Q{q_num}/{questions} ({category.title()}, {difficulty.title()})\n**{question['question']}**\n" + "\n".join(question["options"])
+        if answer_mode == "buttons":
+            view = AnswerView([p.id for p in players])
+            view.message = await queue_channel_send(thread, text + f"\nPlayers: {' '.join([p.mention for p in players])}, pick 1-4 within 20 seconds!", view=view)
+            answers = await view.collect()
+        else:
+            view = None
+            await queue_channel_send(thread, text + f"\nPlayers: {' '.join([p.mention for p in players])}, reply with 1-4 within 20 seconds!")
+            answers = {}
+            try:
+                while len(answers) < len(players):
+                    msg = await wait_for_message(thread.id, [p.id for p in players if p.id not in answers], _is_answer, timeout=20)
+                    answers[msg.author.id] = int(msg.content)
+            except asyncio.TimeoutError:
+                pass
+        results = []
         points = 2 + (5 if question.get("ai_generated", False) else 0)
         for p in players:
             pid = str(p.id)
+            record_question_result(question, answers.get(p.id) == question["answer"])
             if answers.get(p.id) == question["answer"]:
                 scores[pid] += 1
                 progress_data[pid]["points"] += points
@@ -971,10 +2577,17 @@ async def run_group_quiz_duel_session(bot, thread, players, category, questions,
                 progress_data[pid]["category_points"][category] += points
                 if progress_data[pid]["streak"] > 2:
                     progress_data[pid]["points"] = int(progress_data[pid]["points"] * 1.5)
-                await thread.send(f"✅ {p.mention} got it right! (+{points} points)")
+                update_rankings(pid)
+                results.append(f"✅ {p.mention} got it right! (+{points} points)")
             else:
-                await thread.send(f"❌ {p.mention} got it wrong." + (f" Answer: {answers.get(p.id)}" if answers.get(p.id) else ""))
-        await thread.send(f"Correct: {question['options'][question['answer']-1]}")
+                results.append(f"❌ {p.mention} got it wrong." + (f" Answer: {answers.get(p.id)}" if answers.get(p.id) else ""))
+        results.append(f"Correct: {question['options'][question['answer']-1]}")
+        if view:
+            await view.show_results(results)
+        else:
+            # One embed per question. Not awaited, so the next question is fetched while it waits for
+            # send budget; it still goes out as its own message, since text never follows an embed.
+            queue_channel_send(thread, embed=discord.Embed(title=f"📋 Q{q_num} Results", description="\n".join(results), color=0x3498DB))
     # Results
     winner_ids = [pid for pid, score in scores.items() if score == max(scores.values())]
     winners = [p for p in players if str(p.id) in winner_ids]
@@ -988,8 +2601,9 @@ async def run_group_quiz_duel_session(bot, thread, players, category, questions,
         progress_data[wid]["category_points"].setdefault(category, 0)
         progress_data[wid]["category_points"][category] += 10
         await check_roles(w)
-    save_json(PROGRESS_FILE, progress_data)
-    await thread.send(f"🏁 Group Duel complete! {result}")
+    mark_dirty(PROGRESS_FILE, ids)
+    update_rankings(*ids)
+    await queue_channel_send(thread, f"🏁 Group Duel complete! {result}")
     try:
         await thread.edit(archived=True, locked=True)
         await thread.delete()
@@ -1011,14 +2625,18 @@ async def quiz_add(interaction: discord.Interaction, topic: str, question: str,
     if answer not in [1, 2, 3, 4]:
         await interaction.response.send_message("❌ Answer must be 1-4.", ephemeral=True)
         return
-    quizzes[topic.lower()].append({
+    q = {
         "question": question,
         "options": [f"1. {option1}", f"2. {option2}", f"3. {option3}", f"4. {option4}"],
         "answer": answer,
         "ai_generated": False,
         "difficulty": difficulty.lower()
-    })
-    save_json(QUIZZES_FILE, quizzes)
+    }
+    if not add_curated(q, topic):
+        await interaction.response.send_message("❌ That question is already in the bank.", ephemeral=True)
+        return
+    quizzes[topic.lower()].append(q)
+    mark_dirty(QUIZZES_FILE, [topic.lower()])
     await interaction.response.send_message(f"✅ Added quiz question to {topic} ({difficulty}).", ephemeral=True)
 
 @tree.command(name="sync", description="Force sync bot commands")
@@ -1063,7 +2681,7 @@ async def generate_daily_challenge():
     challenges["date"] = datetime.now().strftime("%Y-%m-%d")
     challenges["current"] = random.choice(HARD_CHALLENGES)
     challenges["user_progress"] = {}
-    save_json(CHALLENGES_FILE, challenges)
+    mark_dirty(CHALLENGES_FILE)
     channel = bot.get_channel(ANNOUNCEMENT_CHANNEL_ID)
     await channel.send(f"🌟 **Daily Challenge ({challenges['date']}):** {challenges['current']['task']} (+{challenges['current']['points']} points)")
 
@@ -1091,21 +2709,88 @@ async def progress(interaction: discord.Interaction, user: discord.Member = None
     data = progress_data.get(user_id, {"points": 0, "category_points": {}, "streak": 0, "last_activity": None, "roles_assigned": [], "votes_today": {}})
     embed = discord.Embed(title=f"📊 Progress for {target.display_name}", color=0x3498DB)
     embed.add_field(name="Total Points", value=str(data["points"]), inline=False)
+    rank, ranked = user_rank(user_id)
+    embed.add_field(name="Rank", value=f"#{rank} of {ranked}" if rank else "Unranked", inline=False)
     embed.add_field(name="Streak", value=f"{data['streak']} days", inline=False)
     embed.add_field(name="Category Points", value=", ".join([f"{k}: {v}" for k, v in data["category_points"].items()]) or "None", inline=False)
     embed.add_field(name="Roles", value=", ".join(data["roles_assigned"]) or "None", inline=False)
     await interaction.response.send_message(embed=embed, ephemeral=True if user is None else False)
 
 @tree.command(name="leaderboard", description="View top users by points")
-@app_commands.describe(limit="Number to show (max 10)")
-async def leaderboard(interaction: discord.Interaction, limit: int = 5):
-    sorted_users = sorted(progress_data.items(), key=lambda x: x[1]["points"], reverse=True)[:min(limit, 10)]
-    embed = discord.Embed(title="🏆 Leaderboard", color=0xFFD700)
-    for i, (uid, data) in enumerate(sorted_users, 1):
-        user = await bot.fetch_user(int(uid))
-        embed.add_field(name=f"{i}. {user.name}", value=f"{data['points']} points (Streak: {data['streak']})", inline=False)
+@app_commands.describe(limit="Number to show (max 10)", category="Category board: cybersecurity, blender, webdev, blockchain, general (optional)")
+async def leaderboard(interaction: discord.Interaction, limit: int = 5, category: str = None):
+    category = category.lower() if category else None
+    if category and category not in CATEGORY_BONUSES:
+        await interaction.response.send_message("❌ Invalid category. Use: cybersecurity, blender, webdev, blockchain, general.", ephemeral=True)
+        return
+    key = (min(limit, 10), category)
+    board = rankings.get(category)
+    version = board.version if board else 0
+    cached = _leaderboard_cache.get(key)
+    if cached and cached["expires"] > time.monotonic():
+        if cached["version"] != version:
+            rows = top_users_by_points(*key)
+            if [(uid, points) for uid, _, points in rows] == cached["rows"]:
+                cached["version"] = version
+        if cached["version"] == version:
+            leaderboard_cache_stats["hits"] += 1
+            await interaction.response.send_message(embed=cached["embed"])
+            return
+    leaderboard_cache_stats["misses"] += 1
+    sorted_users = top_users_by_points(*key)
+    embed = discord.Embed(title=f"🏆 {category.title()} Leaderboard" if category else "🏆 Leaderboard", color=0xFFD700)
+    users = await resolve_users([uid for uid, _, _ in sorted_users])
+    for i, ((uid, data, points), user) in enumerate(zip(sorted_users, users), 1):
+        embed.add_field(name=f"{i}. {user.name if user else 'Unknown user'}", value=f"{points} points (Streak: {data['streak']})", inline=False)
+    _leaderboard_cache[key] = {
+        "version": version,
+        "rows": [(uid, points) for uid, _, points in sorted_users],
+        "expires": time.monotonic() + LEADERBOARD_CACHE_TTL_SECONDS,
+        "embed": embed
+    }
     await interaction.response.send_message(embed=embed)
 
+@tree.command(name="bot_stats", description="View bot performance counters (mod only)")
+@is_mod()
+async def bot_stats(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 Bot Stats", color=0x3498DB)
+    depth = sum(len(pool) for pool in question_pool.values())
+    low = ", ".join(f"{c}/{d}: {len(pool)}" for (c, d), pool in question_pool.items() if len(pool) < pool_target((c, d))) or "None"
+    embed.add_field(
+        name="Question Pool",
+        value=f"Depth: {depth} | Hits: {pool_stats['hits']} | Misses: {pool_stats['misses']}\n"
+              f"Refill: {pool_refill_rate()}/min ({pool_stats['refilled']} total, {pool_stats['refill_failures']} failed)\n"
+              f"Below target: {low}",
+        inline=False
+    )
+    models = []
+    for model, s in sorted(model_stats.items(), key=lambda item: _model_score(item[0])):
+        state = "open" if s["open_until"] > time.time() else "ok"
+        models.append(f"`{model.split('/')[-1]}` p50 {model_percentile(model, 0.5) or 0:.1f}s p90 {model_percentile(model, 0.9) or 0:.1f}s | valid {s['valid']}/{s['calls']} | 429 {s['rate_limited']} | 5xx {s['server_errors']} | {state}")
+    embed.add_field(name="Models", value="\n".join(models)[:1024] or "No calls yet", inline=False)
+    embed.add_field(name="Question Bank", value=f"AI: {len(question_bank)} | Curated: {len(_curated)} | Duplicates rejected: {bank_stats['duplicates']} | Evicted: {bank_stats['evicted']}", inline=False)
+    embed.add_field(
+        name="DM Delivery",
+        value=f"Sent: {dm_stats['sent']} | Fallback: {dm_stats['fallback']} | Retries: {dm_stats['retries']} | Failed: {dm_stats['failed']} | Queued: {dm_queued()}\n"
+              f"Latency p50 {dm_latency(0.5) or 0:.2f}s p95 {dm_latency(0.95) or 0:.2f}s",
+        inline=False
+    )
+    kinds = {}
+    for session in active_sessions.values():
+        if session:
+            kinds[session["kind"]] = kinds.get(session["kind"], 0) + 1
+    embed.add_field(
+        name="Sessions",
+        value=f"Active: {len(active_sessions)}/{MAX_ACTIVE_SESSIONS} ({', '.join(f'{k}: {n}' for k, n in kinds.items()) or 'none'}) | Channels: {len(_sessions_by_channel)} | Queued: {len(_session_queue)}\n"
+              f"Started: {session_stats['started']} | Waited: {session_stats['queued']} | Rejected: {session_stats['rejected']} | Wait p50 {session_wait(0.5) or 0:.1f}s p95 {session_wait(0.95) or 0:.1f}s",
+        inline=False
+    )
+    embed.add_field(name="Channel Sends", value=f"Queued: {channel_send_stats['queued']} | Sent: {channel_send_stats['sent']} | Coalesced: {channel_send_stats['coalesced']}", inline=False)
+    embed.add_field(name="User Cache", value=f"Gateway: {user_cache_stats['gateway_hits']} | Cached: {user_cache_stats['hits']} | REST: {user_cache_stats['misses']} | Shared: {user_cache_stats['shared']} | Size: {len(_user_cache)}", inline=False)
+    embed.add_field(name="Leaderboard Cache", value=f"Hits: {leaderboard_cache_stats['hits']} | Rebuilds: {leaderboard_cache_stats['misses']}", inline=False)
+    embed.add_field(name="Storage", value=f"Backend: {STORAGE_BACKEND} | Flushes: {flush_stats['flushes']} | Records: {flush_stats['records']} | Marks: {flush_stats['marks']}", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # =============================
 # Moderation Commands
 # =============================
@@ -1165,40 +2850,42 @@ async def change_status():
 @app_commands.describe(question="What do you want explained? (e.g., 'Explain how blockchains work')")
 async def tutor(interaction: discord.Interaction, question: str):
     await interaction.response.defer(ephemeral=True)
-    if not client:
+    if not OPENROUTER_API_KEY:
         await interaction.followup.send("❌ AI is not configured. Please contact an admin.", ephemeral=True)
         return
     prompt = (
         "You are an expert tutor. Explain the following concept or walk through the solution step-by-step in a clear, beginner-friendly way. "
         "If the user asks for a solution, break it down into logical steps.\n\nQuestion: " + question
     )
-    models = [
+    models = route_models([
         "mistralai/mistral-7b-instruct:free",
         "openchat/openchat-3.5-0106:free",
         "meta-llama/llama-3-8b-instruct:free",
         "meta-llama/llama-2-70b-chat:free",
         "google/gemma-7b-it:free",
         "gryphe/mythomist-7b:free"
-    ]
-    for model in models:
+    ])
+    async def attempt(model):
+        start = time.monotonic()
         try:
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model=model,
-                messages=[
+            answer = await chat_completion(
+                model,
+                [
                     {"role": "system", "content": "You are a helpful AI tutor."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=400,
-                temperature=0.7
+                max_tokens=400
             )
-            answer = response.choices[0].message.content.strip()
-            if answer:
-                await interaction.followup.send(f"🧑‍🏫 **AI Tutor:**\n{answer}", ephemeral=True)
-                return
         except Exception as e:
+            record_model_result(model, "error", status=getattr(e, "status", None))
             print(f"AI Tutor error (model {model}): {e}")
-            continue
+            return None
+        record_model_result(model, "valid" if answer else "invalid", time.monotonic() - start)
+        return answer or None
+    answer = await race_models(models, attempt)
+    if answer:
+        await interaction.followup.send(f"🧑‍🏫 **AI Tutor:**\n{answer}", ephemeral=True)
+        return
     await interaction.followup.send("❌ All AI models are currently rate-limited or unavailable. Please try again later.", ephemeral=True)
 
 
@@ -1220,6 +2907,10 @@ async def on_ready():
             else:
                 print("❌ All sync attempts failed. Use /sync command manually.")
     change_status.start()
+    start_dm_workers()
+    flush_stores_loop.start()
+    refill_question_pool.start()
+    compact_stores.start()
     send_reminders.start()
     task_due_notifications.start()
     generate_daily_challenge.start()
@@ -1228,4 +2919,27 @@ async def on_ready():
 # =============================
 # Run bot
 # =============================
-bot.run(TOKEN)
+async def run_bot():
+    discord.utils.setup_logging()
+    try:
+        # SIGTERM (docker stop, systemd) closes the bot cleanly so the final flush runs.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        await close_http_session()
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate-sqlite"]:
+        migrate_json_to_sqlite()
+    else:
+        try:
+            asyncio.run(run_bot())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Also after a login failure or crash, so pending dirty keys aren't lost.
+            flush_stores_sync()
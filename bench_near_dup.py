@@ -0,0 +1,103 @@
+import random
+import string
+import time
+
+from near_dup import NearDuplicateIndex
+
+# Lookup cost and accuracy of NearDuplicateIndex as the question bank grows to
+# 100k questions. Paraphrases are drawn per kind (reordered clauses, inflected
+# words, an added word, a synonym swap) so recall shows which drift is caught;
+# near misses change or drop one subject word ("HTTP" -> "HTTPS", "TCP" -> "UDP")
+# and must not be reported as duplicates.
+# Run: python bench_near_dup.py
+
+FRAMES = [("What is the role of {} in {}", "In {1}, what role does {0} play"),
+          ("Why would a team choose {} for {}", "For {1}, why would a team choose {0}"),
+          ("How does {} affect {}", "What effect does {} have on {}"),
+          ("What problem does {} solve in {}", "In {1}, which problem is solved by {0}"),
+          ("When should {} be avoided in {}", "In {1}, when is {0} a poor choice")]
+SYNONYMS = {"role": "purpose", "choose": "pick", "affect": "influence", "problem": "issue", "avoided": "skipped"}
+# Ordinary content words, not near_dup.FILLER adverbs, so an added word has to pass extra_threshold.
+ADDED = ["modern", "secure", "large", "shared", "remote"]
+NEAR_MISS = [("What port does HTTP use by default?", "What port does HTTPS use by default?"),
+             ("Is TCP connection oriented?", "Is UDP connection oriented?"),
+             ("How long is an IPv4 address?", "How long is an IPv6 address?"),
+             ("What is the default port of SSH?", "What is the default port of FTP?"),
+             ("Which layer does TLS 1.2 encrypt?", "Which layer does TLS 1.3 encrypt?"),
+             ("What does SQL injection exploit?", "What is SQL injection?")]
+
+
+def make_vocab(rng, size=5000):
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+    acronyms = ["".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 4))) for _ in range(size // 5)]
+    return words + acronyms
+
+
+def make_question(rng, vocab):
+    subject = " ".join(rng.choice(vocab) for _ in range(rng.randint(2, 3)))
+    topic = " ".join(rng.choice(vocab) for _ in range(rng.randint(1, 2)))
+    frame = rng.randrange(len(FRAMES))
+    return (frame, subject, topic), FRAMES[frame][0].format(subject, topic) + "?"
+
+
+def _inflect(word):
+    if not word.islower():
+        return word
+    return word[:-1] + "ies" if word.endswith("y") else word + "s"
+
+
+def paraphrase(rng, parts, kind):
+    frame, subject, topic = parts
+    text = FRAMES[frame][0]
+    if kind == "reorder":
+        text = FRAMES[frame][1]
+    elif kind == "inflect":
+        subject = " ".join(_inflect(w) if i == 0 else w for i, w in enumerate(subject.split()))
+    elif kind == "added word":
+        text = text.replace("{}", rng.choice(ADDED) + " {}", 1)
+    elif kind == "synonym":
+        for word, synonym in SYNONYMS.items():
+            text = text.replace(word, synonym)
+    return text.format(subject, topic) + "?"
+
+
+def near_miss(rng, vocab, parts):
+    frame, subject, topic = parts
+    words = subject.split()
+    words[rng.randrange(len(words))] = rng.choice(vocab)
+    return FRAMES[frame][0].format(" ".join(words), topic) + "?"
+
+
+def main():
+    rng = random.Random(42)
+    vocab = make_vocab(rng)
+    kinds = ["reorder", "inflect", "added word", "synonym"]
+    literal = NearDuplicateIndex()
+    for left, _ in NEAR_MISS:
+        literal.add(left)
+    print("literal near misses flagged:", sum(literal.query(right) is not None for _, right in NEAR_MISS), "/", len(NEAR_MISS))
+    index = NearDuplicateIndex()
+    stored = []
+    print(f"{'bank size':>10} {'add us':>7} {'query us':>9} " + " ".join(f"{k:>10}" for k in kinds) + f" {'novel fp':>9} {'near fp':>8}")
+    for size in [1_000, 10_000, 100_000]:
+        new = [make_question(rng, vocab) for _ in range(size - len(index))]
+        start = time.perf_counter()
+        for _, text in new:
+            index.add(text)
+        add_us = (time.perf_counter() - start) / len(new) * 1e6
+        stored.extend(parts for parts, _ in new)
+        # Probe texts are built up front so only the lookups are timed.
+        probes = rng.sample(stored, 300)
+        variants = {kind: [paraphrase(rng, p, kind) for p in probes] for kind in kinds}
+        novel = [make_question(rng, vocab)[1] for _ in range(300)]
+        near = [near_miss(rng, vocab, p) for p in probes]
+        start = time.perf_counter()
+        recall = [sum(index.query(t) is not None for t in variants[kind]) / len(probes) for kind in kinds]
+        novel_fp = sum(index.query(t) is not None for t in novel) / len(novel)
+        near_fp = sum(index.query(t) is not None for t in near) / len(near)
+        query_us = (time.perf_counter() - start) / (len(kinds) * len(probes) + len(novel) + len(near)) * 1e6
+        print(f"{size:>10} {add_us:>7.0f} {query_us:>9.0f} " + " ".join(f"{r:>10.0%}" for r in recall) + f" {novel_fp:>9.1%} {near_fp:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
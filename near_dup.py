@@ -0,0 +1,166 @@
+import random
+import re
+import struct
+import zlib
+
+# Near-duplicate detection for quiz questions: character 4-gram shingles of the
+# content words -> MinHash signature -> LSH band buckets. Question stems ("What
+# is", "Which of the following") are dropped so that only the subject matter is
+# compared, and shingles never span two words so reordered clauses still collide.
+# A lookup hashes one question and compares signatures only with entries that
+# share a band, so its cost stays flat as the bank grows.
+#
+# Shingles alone cannot tell "HTTP" from "HTTPS" or "IPv4" from "IPv6", so a
+# MinHash hit is confirmed word by word. A word on each side with no counterpart
+# on the other is a substitution and the questions are different. Words on one
+# side only are fine if they are adverbs from FILLER; any other extra word ("What
+# is SQL injection?" vs "What does SQL injection exploit?") is only accepted when
+# the rest of the question is long enough to push similarity past extra_threshold.
+# Acronyms and words containing digits must match exactly; other words may differ
+# by a short suffix.
+
+_PRIME = (1 << 31) - 1
+SHINGLE = 4
+STOPWORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "by", "with", "from", "at", "as", "into",
+    "what", "which", "who", "whom", "why", "how", "when", "where", "whose",
+    "is", "are", "was", "were", "be", "been", "being", "do", "does", "did", "can", "could", "would", "should",
+    "will", "shall", "may", "might", "must", "has", "have", "had",
+    "it", "its", "this", "that", "these", "those", "you", "your", "we", "our", "they", "their",
+    "following", "best", "most", "typically", "usually", "main", "primary", "use", "used", "using"
+}
+# Words that may appear on one side only without changing what is asked.
+FILLER = {
+    "actually", "generally", "commonly", "really", "ultimately", "also", "exactly", "specifically",
+    "precisely", "basically", "essentially", "often", "normally", "mainly", "just", "particular", "specific"
+}
+
+
+def _is_exact(word):
+    # Acronyms ("TCP", "IPv4") and anything with digits never match by prefix.
+    return not word.isalpha() or any(c.isupper() for c in word[1:])
+
+
+def content_words(text):
+    # Content words in order; acronyms keep their case, everything else is lowercased.
+    words = []
+    for word in re.findall(r"[A-Za-z0-9]+", text):
+        lower = word.lower()
+        if lower not in STOPWORDS:
+            words.append(word if _is_exact(word) else lower)
+    return words or [w.lower() for w in re.findall(r"[A-Za-z0-9]+", text)] or [""]
+
+
+def shingles(words):
+    grams = set()
+    for word in words:
+        padded = f" {word.lower()} "
+        grams.update(padded[i:i + SHINGLE] for i in range(max(1, len(padded) - SHINGLE + 1)))
+    return grams
+
+
+def _same_word(a, b):
+    if a.lower() == b.lower():
+        return True
+    if _is_exact(a) or _is_exact(b):
+        return False
+    short, long = sorted((a, b), key=len)
+    return len(short) >= 4 and len(long) - len(short) <= 3 and long.startswith(short)
+
+
+def _unmatched(words, others):
+    return any(w not in FILLER and not any(_same_word(w, o) for o in others) for w in words)
+
+
+def is_substitution(words_a, words_b):
+    # True if each side has a word the other lacks ("HTTP" vs "HTTPS").
+    return _unmatched(words_a, words_b) and _unmatched(words_b, words_a)
+
+
+def has_extra_words(words_a, words_b):
+    # True if either side has a non-filler word the other lacks.
+    return _unmatched(words_a, words_b) or _unmatched(words_b, words_a)
+
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm=48, bands=12, threshold=0.5, extra_threshold=0.8, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.extra_threshold = extra_threshold
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._pack = struct.Struct(f"<{num_perm}I")
+        self._band_width = self.rows * 4
+        self._buckets = [{} for _ in range(bands)]
+        self._sigs = {}
+        self._words = {}
+        self._next_key = 0
+
+    def __len__(self):
+        return len(self._sigs)
+
+    def __contains__(self, text):
+        return self.query(text) is not None
+
+    def signature(self, text):
+        hashes = [zlib.crc32(gram.encode()) for gram in shingles(content_words(text))]
+        return self._pack.pack(*[min([(a * h + b) % _PRIME for h in hashes]) for a, b in self._perms])
+
+    def _band_keys(self, sig):
+        w = self._band_width
+        return [sig[i * w:(i + 1) * w] for i in range(self.bands)]
+
+    def similarity(self, sig_a, sig_b):
+        a = self._pack.unpack(sig_a)
+        b = self._pack.unpack(sig_b)
+        return sum(x == y for x, y in zip(a, b)) / self.num_perm
+
+    def add(self, text, key=None, sig=None):
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+        if key in self._sigs:
+            self.remove(key)
+        sig = sig or self.signature(text)
+        self._sigs[key] = sig
+        self._words[key] = content_words(text)
+        for bucket, band in zip(self._buckets, self._band_keys(sig)):
+            bucket.setdefault(band, []).append(key)
+        return key
+
+    def remove(self, key):
+        sig = self._sigs.pop(key, None)
+        if sig is None:
+            return
+        del self._words[key]
+        for bucket, band in zip(self._buckets, self._band_keys(sig)):
+            keys = bucket.get(band)
+            if keys:
+                keys.remove(key)
+                if not keys:
+                    del bucket[band]
+
+    def query(self, text, sig=None):
+        # Returns the key of a stored near-duplicate of text, or None.
+        sig = sig or self.signature(text)
+        words = None
+        checked = set()
+        for bucket, band in zip(self._buckets, self._band_keys(sig)):
+            for key in bucket.get(band, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                similarity = self.similarity(sig, self._sigs[key])
+                if similarity < self.threshold:
+                    continue
+                if words is None:
+                    words = content_words(text)
+                if is_substitution(words, self._words[key]):
+                    continue
+                if similarity >= self.extra_threshold or not has_extra_words(words, self._words[key]):
+                    return key
+        return None
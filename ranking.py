@@ -0,0 +1,97 @@
+import bisect
+
+# Score ranking kept as a bucketed sorted list: entries are (-score, key) so the
+# highest score sorts first, split into buckets of at most 2 * load entries with
+# each bucket's last entry mirrored in _maxes. An update bisects _maxes to find
+# the bucket and then bisects inside it, so inserts, removals and rank lookups
+# touch one small list plus the bucket headers instead of re-sorting everyone.
+
+
+class RankIndex:
+    def __init__(self, load=256):
+        self._load = load
+        self._buckets = []
+        self._maxes = []
+        self._scores = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, key):
+        return key in self._scores
+
+    def score(self, key):
+        return self._scores.get(key)
+
+    def _locate(self, entry):
+        i = bisect.bisect_left(self._maxes, entry)
+        return min(i, len(self._buckets) - 1)
+
+    def _insert(self, entry):
+        if not self._buckets:
+            self._buckets.append([entry])
+            self._maxes.append(entry)
+            return
+        i = self._locate(entry)
+        bucket = self._buckets[i]
+        bisect.insort(bucket, entry)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self._load:
+            half = bucket[self._load:]
+            del bucket[self._load:]
+            self._buckets.insert(i + 1, half)
+            self._maxes[i] = bucket[-1]
+            self._maxes.insert(i + 1, half[-1])
+
+    def _delete(self, entry):
+        i = self._locate(entry)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, entry)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def update(self, key, score):
+        # Returns True if the ranking changed.
+        old = self._scores.get(key)
+        if old == score:
+            return False
+        if old is not None:
+            self._delete((-old, key))
+        self._scores[key] = score
+        self._insert((-score, key))
+        self.version += 1
+        return True
+
+    def remove(self, key):
+        old = self._scores.pop(key, None)
+        if old is not None:
+            self._delete((-old, key))
+            self.version += 1
+
+    def clear(self):
+        self._buckets.clear()
+        self._maxes.clear()
+        self._scores.clear()
+        self.version += 1
+
+    def top(self, k):
+        result = []
+        for bucket in self._buckets:
+            for neg_score, key in bucket:
+                if len(result) == k:
+                    return result
+                result.append((key, -neg_score))
+        return result
+
+    def rank(self, key):
+        # 1-based position of key, or None if it isn't ranked.
+        score = self._scores.get(key)
+        if score is None:
+            return None
+        entry = (-score, key)
+        i = self._locate(entry)
+        return sum(len(b) for b in self._buckets[:i]) + bisect.bisect_left(self._buckets[i], entry) + 1
@@ -0,0 +1,62 @@
+import bisect
+import re
+
+# Inverted index for short documents (resource titles, tags, descriptions).
+# Postings map a token to {doc id: field weight}; the vocabulary is also kept as a
+# sorted list so a query token can be expanded to every token it prefixes with two
+# bisects. Every query token must match (exactly or as a prefix); exact matches
+# score their field weight and prefix matches half of it.
+
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "description": 1.0}
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+class InvertedIndex:
+    def __init__(self, field_weights=FIELD_WEIGHTS):
+        self.field_weights = field_weights
+        self._postings = {}
+        self._vocab = []
+
+    def add(self, doc_id, **fields):
+        for field, text in fields.items():
+            weight = self.field_weights[field]
+            if isinstance(text, (list, tuple)):
+                text = " ".join(text)
+            for token in tokenize(text):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocab, token)
+                postings[doc_id] = max(postings.get(doc_id, 0), weight)
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_left(self._vocab, prefix + "\uffff", start)
+        return self._vocab[start:end]
+
+    def _match(self, token):
+        # doc id -> score for one query token.
+        scores = dict(self._postings.get(token, {}))
+        for term in self._expand(token):
+            if term == token:
+                continue
+            for doc, weight in self._postings[term].items():
+                if weight / 2 > scores.get(doc, 0):
+                    scores[doc] = weight / 2
+        return scores
+
+    def search(self, query):
+        # doc id -> relevance for documents matching every token of query.
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+        matches = sorted((self._match(token) for token in dict.fromkeys(tokens)), key=len)
+        scores = matches[0]
+        for other in matches[1:]:
+            scores = {doc: score + other[doc] for doc, score in scores.items() if doc in other}
+            if not scores:
+                break
+        return scores